@@ -0,0 +1,91 @@
+"""Adaptive poll interval for Airthings devices."""
+DEFAULT_MIN_INTERVAL = 60.0
+DEFAULT_MAX_INTERVAL = 1800.0
+DEFAULT_GROWTH = 1.5
+
+# Change between two polls that counts as an event
+DEFAULT_THRESHOLDS = {
+    "temperature": 0.5,
+    "humidity": 3.0,
+    "pressure": 2.0,
+    "co2": 100.0,
+    "voc": 50.0,
+    "radon_1day_avg": 20.0,
+}
+
+
+class AdaptiveInterval:
+    """Poll less often while values are stable and more often on changes.
+
+    The interval grows by `growth` after every poll without an event, up
+    to `max_interval`, and drops to `min_interval` as soon as a value
+    moves more than its threshold.
+    """
+
+    def __init__(self, min_interval=DEFAULT_MIN_INTERVAL,
+                 max_interval=DEFAULT_MAX_INTERVAL,
+                 thresholds=None, growth=DEFAULT_GROWTH):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.thresholds = DEFAULT_THRESHOLDS if thresholds is None else thresholds
+        self.growth = growth
+        self.interval = min_interval
+        self._last = None
+
+    def update(self, readings):
+        """Take new readings into account and return the next interval."""
+        if not readings:
+            return self.interval
+        changed = self._last is not None and any(
+            name in readings and name in self._last
+            and abs(readings[name] - self._last[name]) > threshold
+            for name, threshold in self.thresholds.items()
+        )
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * self.growth)
+        self._last = readings
+        return self.interval
+
+
+def simulate(samples, policy, fixed_interval):
+    """Replay a recorded series and compare with a fixed interval.
+
+    `samples` is a time sorted list of (timestamp, readings). A poll at
+    time t sees the latest sample at or before t. Returns a dict with the
+    number of polls of both strategies, the connections saved and the
+    longest time an event went unnoticed by the adaptive policy.
+    """
+    if not samples:
+        return {"polls": 0, "fixed_polls": 0, "saved": 0, "max_delay": 0.0}
+    start, end = samples[0][0], samples[-1][0]
+    fixed_polls = int((end - start) // fixed_interval) + 1
+
+    polls = 0
+    max_delay = 0.0
+    indx = 0
+    seen = None
+    pending_since = None
+    now = start
+    while now <= end:
+        while indx + 1 < len(samples) and samples[indx + 1][0] <= now:
+            indx += 1
+            readings = samples[indx][1]
+            if pending_since is None and seen is not None and any(
+                abs(readings.get(name, 0) - seen.get(name, 0)) > threshold
+                for name, threshold in policy.thresholds.items()
+            ):
+                pending_since = samples[indx][0]
+        seen = samples[indx][1]
+        polls += 1
+        if pending_since is not None:
+            max_delay = max(max_delay, now - pending_since)
+            pending_since = None
+        now += policy.update(seen)
+    return {
+        "polls": polls,
+        "fixed_polls": fixed_polls,
+        "saved": fixed_polls - polls,
+        "max_delay": max_delay,
+    }
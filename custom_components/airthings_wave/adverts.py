@@ -0,0 +1,154 @@
+"""Passive Airthings readings from BLE advertisements."""
+import json
+import logging
+import threading
+import time
+
+from .decoder import WAVE_PLUS_DECODER
+
+_LOGGER = logging.getLogger(__name__)
+
+AIRTHINGS_MANUFACTURER_ID = 0x0334
+MANUFACTURER_DATA_ADTYPE = 255
+SERVICE_UUID_ADTYPES = (6, 7)
+
+WAVE_SERVICE_UUID = "b42e1f6e-ade7-11e4-89d3-123b93f75cba"
+WAVE_PLUS_SERVICE_UUID = "b42e1c08-ade7-11e4-89d3-123b93f75cba"
+
+# The first four digits of the serial number give the model
+WAVE_MODEL = 2900
+WAVE_PLUS_MODEL = 2930
+# Company id and serial number come before the sensor record
+RECORD_OFFSET = 6
+RECORD_VERSION = 1
+
+DEFAULT_MAX_ADVERT_AGE = 600.0
+DEFAULT_SCAN_TIME = 5.0
+DEFAULT_MIN_SCAN_INTERVAL = 60.0
+
+
+class AdvertCache:
+    """Latest readings seen in advertisements, per MAC.
+
+    Manufacturer data is the Airthings company id and the serial number,
+    both little endian, optionally followed by a sensor record. Only
+    adverts with a full record of a known version give readings; adverts
+    with just the serial number are counted and ignored.
+    If `capture_path` is set, every Airthings advert is appended to it as a
+    json line, which `replay_capture` can feed back in offline.
+    """
+
+    def __init__(self, decoder=WAVE_PLUS_DECODER, capture_path=None, clock=time.time):
+        self._decoder = decoder
+        self._capture_path = capture_path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._readings = {}
+        self._last_scan = {}
+        self.discovered = {}
+        self.adverts = 0
+        self.decoded = 0
+
+    def feed(self, mac, manufacturer_data, timestamp=None):
+        """Handle the manufacturer data of one advert."""
+        if timestamp is None:
+            timestamp = self._clock()
+        if len(manufacturer_data) < 2:
+            return None
+        company = manufacturer_data[0] | manufacturer_data[1] << 8
+        if company != AIRTHINGS_MANUFACTURER_ID:
+            return None
+        mac = mac.lower()
+        self.adverts += 1
+        if len(manufacturer_data) >= 6 and mac not in self.discovered:
+            serial = int.from_bytes(manufacturer_data[2:6], "little")
+            model = serial // 1000000
+            if model in (WAVE_MODEL, WAVE_PLUS_MODEL):
+                self.discovered[mac] = model == WAVE_PLUS_MODEL
+        if self._capture_path is not None:
+            self._capture(mac, manufacturer_data, timestamp)
+        record = manufacturer_data[RECORD_OFFSET:RECORD_OFFSET + self._decoder.record.size]
+        if len(record) < self._decoder.record.size:
+            return None
+        if record[0] != RECORD_VERSION:
+            _LOGGER.debug("Ignoring advert from %s with record version %s", mac, record[0])
+            return None
+        readings = self._decoder.decode(record)
+        self.decoded += 1
+        with self._lock:
+            self._readings[mac] = (timestamp, readings)
+        return readings
+
+    def get(self, mac, max_age=DEFAULT_MAX_ADVERT_AGE):
+        """Return advertised readings not older than `max_age`, or None."""
+        entry = self._readings.get(mac.lower())
+        if entry is None or self._clock() - entry[0] > max_age:
+            return None
+        return entry[1]
+
+    def discover(self, scheduler, scan_time=DEFAULT_SCAN_TIME):
+        """Scan once and return {mac: is_plus} for all Airthings seen.
+
+        Devices are recognised by their service UUID, or by the model in
+        the serial number of the manufacturer data.
+        """
+        self.scan(scheduler, scan_time, min_interval=0)
+        return dict(self.discovered)
+
+    def scan(self, scheduler, scan_time=DEFAULT_SCAN_TIME,
+             min_interval=DEFAULT_MIN_SCAN_INTERVAL):
+        """Scan on the adapter of `scheduler` and feed the adverts.
+
+        One scan serves all devices on the adapter, so scans closer than
+        `min_interval` apart are skipped.
+        """
+        import bluepy
+
+        adapter = scheduler.adapter
+        with self._lock:
+            if time.monotonic() - self._last_scan.get(adapter, -min_interval) < min_interval:
+                return
+            self._last_scan[adapter] = time.monotonic()
+        with scheduler.slot():
+            try:
+                devices = bluepy.btle.Scanner(adapter).scan(scan_time)
+            except bluepy.btle.BTLEException:
+                _LOGGER.warning("Scanning on hci%s failed", adapter, exc_info=True)
+                return
+        for device in devices:
+            for adtype in SERVICE_UUID_ADTYPES:
+                services = (device.getValueText(adtype) or "").lower()
+                if WAVE_PLUS_SERVICE_UUID in services:
+                    self.discovered[device.addr.lower()] = True
+                elif WAVE_SERVICE_UUID in services:
+                    self.discovered[device.addr.lower()] = False
+            data = device.getValueText(MANUFACTURER_DATA_ADTYPE)
+            if data:
+                self.feed(device.addr, bytes.fromhex(data))
+
+    def _capture(self, mac, manufacturer_data, timestamp):
+        try:
+            with open(self._capture_path, "a") as capture_file:
+                capture_file.write(
+                    json.dumps(
+                        {"time": timestamp, "mac": mac, "data": manufacturer_data.hex()}
+                    )
+                    + "\n"
+                )
+        except OSError:
+            _LOGGER.warning("Could not write capture %s", self._capture_path, exc_info=True)
+
+    def replay_capture(self, path):
+        """Feed the adverts of a capture file, returns the number of lines."""
+        count = 0
+        with open(path) as capture_file:
+            for line in capture_file:
+                if not line.strip():
+                    continue
+                advert = json.loads(line)
+                self.feed(advert["mac"], bytes.fromhex(advert["data"]), advert["time"])
+                count += 1
+        return count
+
+
+ADVERT_CACHE = AdvertCache()
@@ -1,319 +1,681 @@
-import struct
+import asyncio
+import json
+import os
+import random
 import time
 import threading
 
 import logging
-from datetime import datetime
+from contextlib import asynccontextmanager, contextmanager
 
-USE_BLUEPY = True
-if USE_BLUEPY:
-    import bluepy
-else:
-    import pygatt
-    from pygatt.exceptions import BLEError, NotConnectedError, NotificationTimeout
+from .adverts import ADVERT_CACHE, DEFAULT_MAX_ADVERT_AGE
+from .history import DEFAULT_HISTORY_SAMPLES, DEFAULT_HISTORY_WINDOW, DeviceHistory
+from .decoder import (
+    WAVE_DECODER,
+    WAVE_PLUS_DECODER,
+    WAVE_PLUS_SENSORS,
+    WAVE_PLUS_UUID,
+    WAVE_SENSORS,
+    Readings,
+)
 
-LOCK = threading.Lock()
+from .transport import DEFAULT_TRANSPORT, TRANSPORTS, BluepyTransport
+
+try:
+    from bleak import BleakClient
+    from bleak.exc import BleakError
+
+    ASYNC_READ_ERRORS = (BleakError, OSError)
+except ImportError:
+    BleakClient = None
+    ASYNC_READ_ERRORS = ()
 
 _LOGGER = logging.getLogger(__name__)
 _LOGGER.setLevel(0)
 
+DEFAULT_ADAPTER = 0
 DEFAULT_RETRY_COUNT = 5
 DEFAULT_RETRY_TIMEOUT = 0.5
+DEFAULT_RETRY_MAX_DELAY = 8.0
+DEFAULT_POLL_BUDGET = 60.0
+DEFAULT_BREAKER_THRESHOLD = 3
+DEFAULT_BREAKER_COOLDOWN = 900.0
+DEFAULT_SLOT_TIME = 20.0
+DEFAULT_IDLE_TIMEOUT = 900.0
+
+
+class SlotTimeout(Exception):
+    """Raised when a read cannot be done before its deadline."""
+
+
+class AdapterScheduler:
+    """Queue BLE reads on one HCI adapter.
+
+    Reads on the same adapter are served one at a time in FIFO order, while
+    different adapters have their own scheduler and run in parallel. Every
+    read attempt gets a slot of `slot_time` seconds, and retries queue up
+    again instead of keeping the adapter busy. A read that gives up waiting
+    leaves its place in the queue to the next one.
+    """
+
+    def __init__(self, adapter, slot_time=DEFAULT_SLOT_TIME):
+        self.adapter = adapter
+        self.slot_time = slot_time
+        self._cond = threading.Condition()
+        self._next_ticket = 0
+        self._serving = 0
+        self._abandoned = set()
+        self.reads = 0
+        self.last_wait = 0.0
+        self.max_wait = 0.0
+        self.total_wait = 0.0
+
+    @property
+    def queue_depth(self):
+        """Number of reads waiting for or holding the adapter."""
+        with self._cond:
+            return self._next_ticket - self._serving - len(self._abandoned)
+
+    @property
+    def mean_wait(self):
+        """Mean time in seconds a read waited for the adapter."""
+        if not self.reads:
+            return 0.0
+        return self.total_wait / self.reads
+
+    @contextmanager
+    def slot(self, timeout=None):
+        """Wait for the adapter and yield the deadline of the slot.
+
+        Raises SlotTimeout if the adapter is not free within `timeout` seconds.
+        """
+        self._acquire(timeout)
+        try:
+            yield time.monotonic() + self.slot_time
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def async_slot(self, timeout=None):
+        """Async version of slot(), waiting for the adapter in an executor thread."""
+        future = asyncio.get_running_loop().run_in_executor(None, self._acquire, timeout)
+        try:
+            await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # Give the slot back as soon as the wait for it ends
+            future.add_done_callback(lambda done: done.exception() is None and self._release())
+            raise
+        try:
+            yield time.monotonic() + self.slot_time
+        finally:
+            self._release()
 
+    def _acquire(self, timeout):
+        start = time.monotonic()
+        with self._cond:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            while self._serving != ticket:
+                remaining = None if timeout is None else start + timeout - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._abandoned.add(ticket)
+                    raise SlotTimeout("hci{} was not free within {:.1f} s".format(self.adapter, timeout))
+                self._cond.wait(remaining)
+        wait = time.monotonic() - start
+        self.reads += 1
+        self.last_wait = wait
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        if wait > self.slot_time:
+            _LOGGER.debug("Waited %.1f s for hci%s", wait, self.adapter)
 
-class Sensor:
-    def __init__(self, name, uuid, format_type, unit, scale, indx=None):
-        self.name = name
-        self.uuid = uuid
-        self.format_type = format_type
-        self.unit = unit
-        self.scale = scale
-        self.indx = indx
+    def _release(self):
+        with self._cond:
+            self._serving += 1
+            while self._serving in self._abandoned:
+                self._abandoned.remove(self._serving)
+                self._serving += 1
+            self._cond.notify_all()
+
+
+_SCHEDULERS = {}
+_SCHEDULERS_LOCK = threading.Lock()
+
+
+def get_scheduler(adapter=DEFAULT_ADAPTER):
+    """Return the shared scheduler for an HCI adapter."""
+    with _SCHEDULERS_LOCK:
+        if adapter not in _SCHEDULERS:
+            _SCHEDULERS[adapter] = AdapterScheduler(adapter)
+        return _SCHEDULERS[adapter]
+
+
+class RetryEngine:
+    """Retry reads with exponential backoff, a deadline and a circuit breaker.
+
+    The backoff sleep happens between attempts, outside any adapter slot,
+    so other devices can use the adapter while a failing one waits. After
+    `breaker_threshold` failed polls in a row a device is skipped for
+    `breaker_cooldown` seconds. `clock`, `sleep`, `async_sleep` and `rand`
+    can be replaced by fakes in tests.
+    """
+
+    def __init__(
+        self,
+        base_delay=DEFAULT_RETRY_TIMEOUT,
+        max_delay=DEFAULT_RETRY_MAX_DELAY,
+        budget=DEFAULT_POLL_BUDGET,
+        breaker_threshold=DEFAULT_BREAKER_THRESHOLD,
+        breaker_cooldown=DEFAULT_BREAKER_COOLDOWN,
+        clock=time.monotonic,
+        sleep=time.sleep,
+        rand=random.random,
+        async_sleep=asyncio.sleep,
+    ):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self._clock = clock
+        self._sleep = sleep
+        self._rand = rand
+        self._async_sleep = async_sleep
+        self._failures = {}
+        self._open_until = {}
+
+    def backoff(self, attempt):
+        """Return the delay before retry number `attempt`, with jitter."""
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay / 2 + self._rand() * delay / 2
+
+    def is_open(self, key):
+        """Return True if reads for `key` are currently skipped."""
+        return self._open_until.get(key, 0) > self._clock()
+
+    def _retry_delay(self, attempt, retry_count, deadline):
+        """Return the delay before the next attempt, or None to give up."""
+        delay = self.backoff(attempt)
+        if attempt >= retry_count or self._clock() + delay > deadline:
+            return None
+        _LOGGER.warning(
+            "Cannot connect to Airthings. Retrying (remaining: %d)...",
+            retry_count - attempt,
+        )
+        return delay
+
+    def _failed(self, key):
+        _LOGGER.error("Airthings communication failed. Stopping trying.")
+        failures = self._failures.get(key, 0) + 1
+        self._failures[key] = failures
+        if failures >= self.breaker_threshold:
+            _LOGGER.warning(
+                "%s failed %d polls in a row, pausing it for %d s",
+                key,
+                failures,
+                self.breaker_cooldown,
+            )
+            self._open_until[key] = self._clock() + self.breaker_cooldown
+            self._failures[key] = 0
+
+    def run(self, key, func, errors, retry_count=DEFAULT_RETRY_COUNT):
+        """Call `func` until it succeeds, returning None if it never does."""
+        if self.is_open(key):
+            _LOGGER.debug("Skipping %s, circuit breaker is open", key)
+            return None
+        deadline = self._clock() + self.budget
+        attempt = 0
+        while True:
+            try:
+                result = func()
+            except errors:
+                _LOGGER.warning("Error talking to Airthings.", exc_info=True)
+            else:
+                self._failures.pop(key, None)
+                return result
+            delay = self._retry_delay(attempt, retry_count, deadline)
+            if delay is None:
+                break
+            attempt += 1
+            self._sleep(delay)
+        self._failed(key)
+        return None
+
+    async def async_run(self, key, func, errors, retry_count=DEFAULT_RETRY_COUNT):
+        """Await `func()` until it succeeds, returning None if it never does.
+
+        Every attempt is cancelled when the poll budget runs out.
+        """
+        if self.is_open(key):
+            _LOGGER.debug("Skipping %s, circuit breaker is open", key)
+            return None
+        deadline = self._clock() + self.budget
+        attempt = 0
+        while True:
+            try:
+                result = await asyncio.wait_for(
+                    func(), max(deadline - self._clock(), 0)
+                )
+            except errors + (asyncio.TimeoutError,):
+                _LOGGER.warning("Error talking to Airthings.", exc_info=True)
+            else:
+                self._failures.pop(key, None)
+                return result
+            delay = self._retry_delay(attempt, retry_count, deadline)
+            if delay is None:
+                break
+            attempt += 1
+            await self._async_sleep(delay)
+        self._failed(key)
+        return None
+
+
+RETRY_ENGINE = RetryEngine()
+
+
+async def async_poll_all(devices):
+    """Poll many devices concurrently on the running event loop.
+
+    Devices on the same adapter are still read one at a time.
+    """
+    return await asyncio.gather(*(device.async_poll() for device in devices))
+
+
+class HandleCache:
+    """GATT value handles per MAC and characteristic UUID.
+
+    Reading by handle skips the characteristic discovery round-trip. The
+    handles are stored as json in `path`, if given, so they survive a
+    restart.
+    """
+
+    def __init__(self, path=None):
+        self._path = path
+        self._lock = threading.Lock()
+        self._handles = {}
+        if path is not None and os.path.isfile(path):
+            try:
+                with open(path) as cache_file:
+                    self._handles = json.load(cache_file)
+            except (OSError, ValueError):
+                _LOGGER.warning("Could not load handle cache %s", path, exc_info=True)
+
+    def get(self, mac, uuid):
+        return self._handles.get(mac, {}).get(uuid)
+
+    def set(self, mac, uuid, handle):
+        with self._lock:
+            self._handles.setdefault(mac, {})[uuid] = handle
+            self._save()
+
+    def invalidate(self, mac):
+        with self._lock:
+            if self._handles.pop(mac, None) is not None:
+                self._save()
+
+    def _save(self):
+        if self._path is None:
+            return
+        try:
+            with open(self._path, "w") as cache_file:
+                json.dump(self._handles, cache_file)
+        except OSError:
+            _LOGGER.warning("Could not save handle cache %s", self._path, exc_info=True)
 
 
 class AirthingsWave:
     def __init__(
-        self, mac, scan_interval, retry_count=DEFAULT_RETRY_COUNT, is_plus=False
+        self,
+        mac,
+        scan_interval,
+        retry_count=DEFAULT_RETRY_COUNT,
+        is_plus=False,
+        adapter=DEFAULT_ADAPTER,
+        retry_engine=RETRY_ENGINE,
+        keep_connected=False,
+        idle_timeout=DEFAULT_IDLE_TIMEOUT,
+        handle_cache=None,
+        passive=False,
+        max_advert_age=DEFAULT_MAX_ADVERT_AGE,
+        advert_cache=ADVERT_CACHE,
+        history_samples=DEFAULT_HISTORY_SAMPLES,
+        history_window=DEFAULT_HISTORY_WINDOW,
+        transport=DEFAULT_TRANSPORT,
+        adaptive=None,
     ) -> None:
         self._mac = mac
         self._is_plus = is_plus
-        self._device = None
+        if isinstance(transport, str):
+            transport = TRANSPORTS[transport](mac, adapter)
+        self._transport = transport
         self._retry_count = retry_count
-        self.sensors = []
-        # self.sensors.append(Sensor("date_time", bluepy.btle.UUID(0x2A08), 'HBBBBB', "\t", 0))
-
+        self._adapter = adapter
+        self._scheduler = get_scheduler(adapter)
+        self._retry_engine = retry_engine
+        self._keep_connected = keep_connected
+        self._idle_timeout = idle_timeout
+        self._idle_timer = None
+        self._last_used = 0.0
+        self._conn_lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._handle_cache = handle_cache if handle_cache is not None else HandleCache()
+        self._passive = passive
+        self._max_advert_age = max_advert_age
+        self._advert_cache = advert_cache
+        self.connects = 0
+        self.reuses = 0
         if is_plus:
-            self.sensors.append(Sensor("humidity", None, None, "%", 1.0 / 2, indx=1))
-            self.sensors.append(
-                Sensor("radon_1day_avg", None, None, "Bq/m3", 1.0, indx=4)
-            )
-            self.sensors.append(
-                Sensor("radon_longterm_avg", None, None, "Bq/m3", 1.0, indx=5)
-            )
-            self.sensors.append(
-                Sensor("temperature", None, None, "ºC", 1.0 / 100, indx=6)
-            )
-            self.sensors.append(Sensor("pressure", None, None, "hPa", 1.0 / 50, indx=7))
-            self.sensors.append(Sensor("co2", None, None, "ppm", 1.0, indx=8))
-            self.sensors.append(Sensor("voc", None, None, "ppb", 1.0, indx=9))
+            self.sensors = list(WAVE_PLUS_SENSORS)
+            self._decoder = WAVE_PLUS_DECODER
         else:
-            self.sensors.append(
-                Sensor(
-                    "temperature",
-                    "00002a6e-0000-1000-8000-00805f9b34fb",
-                    "h",
-                    "ºC",
-                    1.0 / 100.0,
-                )
-            )
-            self.sensors.append(
-                Sensor(
-                    "humidity",
-                    "00002a6f-0000-1000-8000-00805f9b34fb",
-                    "H",
-                    "%",
-                    1.0 / 100.0,
-                )
-            )
-            self.sensors.append(
-                Sensor(
-                    "radon_1day_avg",
-                    "b42e01aa-ade7-11e4-89d3-123b93f75cba",
-                    "H",
-                    "Bq/m3",
-                    1.0,
-                )
-            )
-            self.sensors.append(
-                Sensor(
-                    "radon_longterm_avg",
-                    "b42e0a4c-ade7-11e4-89d3-123b93f75cba",
-                    "H",
-                    "Bq/m3",
-                    1.0,
-                )
-            )
+            self.sensors = list(WAVE_SENSORS)
+            self._decoder = WAVE_DECODER
 
-        self.readings = {}
+        self.readings = Readings()
+        self.history = DeviceHistory(history_samples, history_window)
         self.scan_interval = scan_interval
         self.last_scan = -1
+        self._adaptive = adaptive
+        if adaptive is not None:
+            self.scan_interval = adaptive.interval
+        self._listeners = []
+        self.physical_reads = 0
+        self.advert_reads = 0
+        self.entity_updates = 0
+        self.last_poll_duration = None
+        self._total_poll_duration = 0.0
 
     @property
     def mac(self):
         return self._mac
 
+    @property
+    def scheduler(self):
+        return self._scheduler
+
+    @property
+    def transport(self):
+        return self._transport
+
     def is_connected(self):
-        if USE_BLUEPY:
-            try:
-                return self._device.getState() == "conn"
-            except Exception:
-                return False
-        else:
-            return self._device is not None
+        return self._transport.is_connected()
 
-    def _connect(self) -> None:
+    def _connect(self, deadline) -> None:
         if self.is_connected():
+            self.reuses += 1
             return
-        if USE_BLUEPY:
-            try:
-                _LOGGER.debug("Connecting to Airthings...")
-                self._device = bluepy.btle.Peripheral(self._mac)
-                _LOGGER.debug("Connected to Airthings.")
-            except bluepy.btle.BTLEException:
-                _LOGGER.debug("Failed connecting to Airthings.", exc_info=True)
-                self._device = None
-                raise
-        else:
-            _LOGGER.debug("Connecting to Airthings...")
-            self._device = pygatt.backends.GATTToolBackend()
-            _LOGGER.debug("Connected to Airthings.")
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise SlotTimeout("No time left to connect to {}".format(self._mac))
+        self.connects += 1
+        self._transport.connect(remaining)
 
     def _disconnect(self) -> None:
-        if not self.is_connected or self._device is None:
+        self._transport.disconnect()
+
+    def _schedule_idle_disconnect(self) -> None:
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+        self._idle_timer = threading.Timer(self._idle_timeout, self._idle_disconnect)
+        self._idle_timer.daemon = True
+        self._idle_timer.start()
+
+    def _idle_disconnect(self) -> None:
+        with self._conn_lock:
+            if time.monotonic() - self._last_used < self._idle_timeout:
+                return
+            _LOGGER.debug("Connection to %s idle, dropping it", self._mac)
+            self._disconnect()
+
+    def close(self) -> None:
+        """Drop a kept connection."""
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+        with self._conn_lock:
+            self._disconnect()
+
+    def _store(self, readings):
+        if readings is self.readings:
             return
-        _LOGGER.debug("Disconnecting")
-        if USE_BLUEPY:
-            try:
-                self._device.disconnect()
-            except bluepy.btle.BTLEException:
-                _LOGGER.warning("Error disconnecting from Airthings.", exc_info=True)
-            finally:
-                self._device = None
-        else:
-            try:
-                self._device.disconnect()
-            except bluepy.btle.BTLEException:
-                _LOGGER.warning("Error disconnecting from Airthings.", exc_info=True)
-            finally:
-                self._device = None
+        self.readings = readings
+        self.history.add(time.time(), readings)
+        if self._adaptive is not None:
+            self.scan_interval = self._adaptive.update(readings)
 
-    def get_readings(self):
-        if time.monotonic() - self.last_scan < self.scan_interval:
-            return self.readings
+    @property
+    def advert_ratio(self):
+        """Share of polls served from advertisements instead of a connection."""
+        polls = self.advert_reads + self.physical_reads
+        if not polls:
+            return 0.0
+        return self.advert_reads / polls
+
+    def _from_adverts(self, scan):
+        """Return fresh advertised readings, or None if a read is needed."""
+        if not self._passive:
+            return None
+        readings = self._advert_cache.get(self._mac, self._max_advert_age)
+        if readings is None and scan and isinstance(self._transport, BluepyTransport):
+            self._advert_cache.scan(self._scheduler)
+            readings = self._advert_cache.get(self._mac, self._max_advert_age)
+        if readings is None:
+            return None
         self.last_scan = time.monotonic()
-        with LOCK:
-            if USE_BLUEPY:
-                if self._is_plus:
-                    return self._get_readings_plus(self._retry_count)
-                return self._get_readings(self._retry_count)
-            else:
-                if self._is_plus:
-                    return self._get_readings_plus_pygatt(self._retry_count)
-                return self._get_readings_pygatt(self._retry_count)
+        self.advert_reads += 1
+        self._store(readings)
+        return readings
 
-    def _get_readings(self, retry):
-        _LOGGER.debug("Reading from Airthings")
-        readings = dict()
+    @property
+    def mean_poll_duration(self):
+        """Mean duration in seconds of the polls that read the device."""
+        if not self.physical_reads:
+            return None
+        return self._total_poll_duration / self.physical_reads
+
+    @property
+    def updates_per_read(self):
+        """Entity updates served per physical read of the device."""
+        if not self.physical_reads:
+            return 0.0
+        return self.entity_updates / self.physical_reads
+
+    def subscribe(self, listener):
+        """Call `listener` with the readings after every poll.
+
+        Returns a function that removes the listener again.
+        """
+        self._listeners.append(listener)
+        return lambda: self._listeners.remove(listener)
 
+    def is_due(self):
+        """Return True if the scan interval has passed since the last read."""
+        return time.monotonic() - self.last_scan >= self.scan_interval
+
+    def poll(self, force=True):
+        """Read the device once and push the readings to all listeners.
+
+        With force=False nothing is read before the device is due. Nothing
+        is read either while a previous poll is still queued or retrying.
+        """
+        if not force and not self.is_due():
+            return None
+        if not self._poll_lock.acquire(blocking=False):
+            _LOGGER.debug("%s: previous poll still running, skipping", self._mac)
+            return None
         try:
-            self._connect()
-            for sensor in self.sensors:
-                char = self._device.getCharacteristics(uuid=sensor.uuid)[0]
-                if char.supportsRead():
-                    val = char.read()
-                    if val is None:
-                        continue
-                    val = struct.unpack(sensor.format_type, val)
-                    if sensor.name == "date_time":
-                        readings[sensor.name] = str(
-                            datetime(val[0], val[1], val[2], val[3], val[4], val[5])
-                        )
-                    else:
-                        readings[sensor.name] = round(val[0] * sensor.scale, 2)
-            self.readings = readings
-            return readings
-        except bluepy.btle.BTLEException:
-            _LOGGER.warning("Error talking to Airthings.", exc_info=True)
+            readings = self._fetch()
         finally:
-            self._disconnect()
-        if retry < 1:
-            _LOGGER.error(
-                "Airthings communication failed. Stopping trying.", exc_info=True
-            )
-            return readings
-        _LOGGER.warning(
-            "Cannot connect to Airthings. Retrying (remaining: %d)...", retry
+            self._poll_lock.release()
+        for listener in list(self._listeners):
+            listener(readings)
+        self.entity_updates += len(self._listeners)
+        _LOGGER.debug(
+            "%s: %.1f entity updates per read", self._mac, self.updates_per_read
         )
-        time.sleep(DEFAULT_RETRY_TIMEOUT)
-        return self._get_readings(retry - 1)
+        return readings
 
-    def _get_readings_plus(self, retry):
-        _LOGGER.debug("Reading from Airthings")
-        readings = dict()
+    @property
+    def supports_async(self):
+        """Return True if bleak is available for async reads."""
+        return BleakClient is not None
 
+    async def async_poll(self, force=True):
+        """Async version of poll()."""
+        if not force and not self.is_due():
+            return None
+        if not self._poll_lock.acquire(blocking=False):
+            _LOGGER.debug("%s: previous poll still running, skipping", self._mac)
+            return None
         try:
-            self._connect()
-            char = self._device.getCharacteristics(
-                uuid="b42e2a68-ade7-11e4-89d3-123b93f75cba"
-            )[0]
-            rawdata = char.read()
-            rawdata = struct.unpack("BBBBHHHHHHHH", rawdata)
-            if rawdata[0] != 1:
-                _LOGGER.error("Invalid version, %s", rawdata)
-            k = 1
-            for sensor in self.sensors:
-                readings[sensor.name] = round(rawdata[sensor.indx] * sensor.scale, 2)
-                k += 1
-            self.readings = readings
-            return readings
-        except bluepy.btle.BTLEException:
-            _LOGGER.warning("Error talking to Airthings.", exc_info=True)
+            readings = await self._async_fetch()
         finally:
-            self._disconnect()
-        if retry < 1:
-            _LOGGER.error(
-                "Airthings communication failed. Stopping trying.", exc_info=True
+            self._poll_lock.release()
+        for listener in list(self._listeners):
+            listener(readings)
+        self.entity_updates += len(self._listeners)
+        return readings
+
+    async def async_get_readings(self):
+        """Async version of get_readings(), reading with bleak.
+
+        Without bleak the blocking read runs in an executor thread.
+        """
+        if not self.is_due():
+            return self.readings
+        return await self._async_fetch()
+
+    async def _async_fetch(self):
+        readings = self._from_adverts(scan=False)
+        if readings is not None:
+            return readings
+        if BleakClient is None:
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self._fetch
             )
+        self.last_scan = time.monotonic()
+        self.physical_reads += 1
+        deadline = self.last_scan + self._retry_engine.budget
+        readings = await self._retry_engine.async_run(
+            self._mac,
+            lambda: self._async_read_once(deadline),
+            ASYNC_READ_ERRORS + (SlotTimeout,),
+            self._retry_count,
+        )
+        self.last_poll_duration = time.monotonic() - self.last_scan
+        self._total_poll_duration += self.last_poll_duration
+        if readings is None:
+            return Readings()
+        self._store(readings)
+        return readings
+
+    async def _async_read_once(self, poll_deadline):
+        """Read with bleak in the same adapter slots as the threaded reads."""
+        async with self._scheduler.async_slot(
+            poll_deadline - time.monotonic()
+        ) as slot_deadline:
+            timeout = min(slot_deadline, poll_deadline) - time.monotonic()
+            return await asyncio.wait_for(self._async_read(), max(timeout, 0))
+
+    async def _async_read(self):
+        self.connects += 1
+        async with BleakClient(
+            self._mac, adapter="hci{}".format(self._adapter)
+        ) as client:
+            if self._is_plus:
+                data = await client.read_gatt_char(WAVE_PLUS_UUID)
+                return self._decoder.decode(bytes(data))
+            values = {}
+            for sensor in self.sensors:
+                values[sensor.uuid] = bytes(await client.read_gatt_char(sensor.uuid))
+            return self._decoder.decode(values)
+
+    def get_readings(self):
+        if not self.is_due():
+            return self.readings
+        return self._fetch()
+
+    def _fetch(self):
+        readings = self._from_adverts(scan=True)
+        if readings is not None:
             return readings
-        _LOGGER.warning(
-            "Cannot connect to Airthings. Retrying (remaining: %d)...", retry
+        self.last_scan = time.monotonic()
+        self.physical_reads += 1
+        deadline = self.last_scan + self._retry_engine.budget
+        readings = self._retry_engine.run(
+            self._mac,
+            lambda: self._read_once(deadline),
+            self._transport.errors + (SlotTimeout,),
+            self._retry_count,
         )
-        time.sleep(DEFAULT_RETRY_TIMEOUT)
-        return self._get_readings_plus(retry - 1)
+        self.last_poll_duration = time.monotonic() - self.last_scan
+        self._total_poll_duration += self.last_poll_duration
+        if readings is None:
+            return Readings()
+        self._store(readings)
+        return readings
 
-    def _get_readings_pygatt(self, retry):
-        _LOGGER.debug("Reading from Airthings")
-        readings = dict()
+    def _read_once(self, poll_deadline):
+        """Read in one adapter slot, ending before the slot or the poll runs out.
 
-        try:
-            self._connect()
-            self._device.start(reset_on_start=False)
-            dev = self._device.connect(self._mac, 60)
-            _LOGGER.debug("Connected")
+        Reads by handle have no timeout, so the connection is dropped when
+        the deadline passes, which makes a hung read fail.
+        """
+        with self._scheduler.slot(poll_deadline - time.monotonic()) as slot_deadline, self._conn_lock:
+            deadline = min(slot_deadline, poll_deadline)
+            watchdog = threading.Timer(deadline - time.monotonic(), self._deadline_passed)
+            watchdog.daemon = True
+            watchdog.start()
             try:
-                for sensor in self.sensors:
-                    data = dev.char_read(sensor.uuid)
-                    val = struct.unpack(sensor.format_type, data)
-                    if sensor.name == "date_time":
-                        readings[sensor.name] = str(
-                            datetime(val[0], val[1], val[2], val[3], val[4], val[5])
-                        )
-                    else:
-                        readings[sensor.name] = round(val[0] * sensor.scale, 2)
-                self.readings = readings
-                return readings
-            except (BLEError, NotConnectedError, NotificationTimeout):
-                _LOGGER.error(
-                    "connection to {} failed".format(self._mac), exc_info=True
-                )
+                reused = self.is_connected()
+                try:
+                    return self._read(deadline)
+                except self._transport.errors:
+                    if not reused:
+                        raise
+                    _LOGGER.debug("Kept connection to %s lost, reconnecting", self._mac)
+                return self._read(deadline)
             finally:
-                dev.disconnect()
-        except (BLEError, NotConnectedError, NotificationTimeout):
-            _LOGGER.error("Failed to connect", exc_info=True)
-        finally:
-            self._device.stop()
+                watchdog.cancel()
 
-        if retry < 1:
-            _LOGGER.error(
-                "Airthings communication failed. Stopping trying.", exc_info=True
-            )
-            return readings
-        _LOGGER.warning(
-            "Cannot connect to Airthings. Retrying (remaining: %d)...", retry
-        )
-        time.sleep(DEFAULT_RETRY_TIMEOUT)
-        return self._get_readings_pygatt(retry - 1)
+    def _deadline_passed(self):
+        _LOGGER.warning("Read from %s did not finish in time, disconnecting", self._mac)
+        self._disconnect()
 
-    def _get_readings_plus_pygatt(self, retry):
+    def _read(self, deadline):
         _LOGGER.debug("Reading from Airthings")
-        readings = dict()
-
         try:
-            self._connect()
-            self._device.start(reset_on_start=False)
-            dev = self._device.connect(self._mac, 60)
-            _LOGGER.debug("Connected")
-            try:
-                data = dev.char_read("b42e2a68-ade7-11e4-89d3-123b93f75cba")
-                rawdata = struct.unpack("BBBBHHHHHHHH", data)
-                if rawdata[0] != 1:
-                    _LOGGER.error("Invalid version, %s", rawdata)
-                k = 1
+            self._connect(deadline)
+            if self._is_plus:
+                readings = self._decoder.decode(self._read_char(WAVE_PLUS_UUID))
+            else:
+                values = {}
                 for sensor in self.sensors:
-                    readings[sensor.name] = round(
-                        rawdata[sensor.indx] * sensor.scale, 2
-                    )
-                    k += 1
-                self.readings = readings
-                return readings
-            except (BLEError, NotConnectedError, NotificationTimeout):
-                _LOGGER.error(
-                    "connection to {} failed".format(self._mac), exc_info=True
-                )
-            finally:
-                dev.disconnect()
-        except (BLEError, NotConnectedError, NotificationTimeout):
-            _LOGGER.error("Failed to connect", exc_info=True)
-        finally:
-            self._device.stop()
+                    val = self._read_char(sensor.uuid)
+                    if val is not None:
+                        values[sensor.uuid] = val
+                readings = self._decoder.decode(values)
+        except Exception:
+            self._disconnect()
+            raise
+        self._last_used = time.monotonic()
+        if self._keep_connected:
+            self._schedule_idle_disconnect()
+        else:
+            self._disconnect()
+        return readings
 
-        if retry < 1:
-            _LOGGER.error(
-                "Airthings communication failed. Stopping trying.", exc_info=True
-            )
-            return readings
-        _LOGGER.warning(
-            "Cannot connect to Airthings. Retrying (remaining: %d)...", retry
-        )
-        time.sleep(DEFAULT_RETRY_TIMEOUT)
-        return self._get_readings_plus_pygatt(retry - 1)
+    def _read_char(self, uuid):
+        """Read a characteristic, by cached handle when known."""
+        handle = self._handle_cache.get(self._mac, uuid)
+        if handle is not None:
+            try:
+                return self._transport.read_handle(handle)
+            except self._transport.errors:
+                _LOGGER.debug("Reading handle %s failed, rediscovering", handle)
+                self._handle_cache.invalidate(self._mac)
+        handle = self._transport.discover(uuid)
+        if handle is None:
+            return None
+        self._handle_cache.set(self._mac, uuid, handle)
+        return self._transport.read_handle(handle)
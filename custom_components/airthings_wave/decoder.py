@@ -0,0 +1,207 @@
+"""Decoders for Airthings Wave payloads."""
+import logging
+import struct
+
+_LOGGER = logging.getLogger(__name__)
+
+WAVE_PLUS_UUID = "b42e2a68-ade7-11e4-89d3-123b93f75cba"
+
+
+class Sensor:
+    def __init__(self, name, uuid, format_type, unit, scale, indx=None):
+        self.name = name
+        self.uuid = uuid
+        self.format_type = format_type
+        self.unit = unit
+        self.scale = scale
+        self.indx = indx
+
+
+# Sensor("date_time", bluepy.btle.UUID(0x2A08), 'HBBBBB', "\t", 0)
+WAVE_SENSORS = (
+    Sensor(
+        "temperature",
+        "00002a6e-0000-1000-8000-00805f9b34fb",
+        "h",
+        "ºC",
+        1.0 / 100.0,
+    ),
+    Sensor(
+        "humidity",
+        "00002a6f-0000-1000-8000-00805f9b34fb",
+        "H",
+        "%",
+        1.0 / 100.0,
+    ),
+    Sensor(
+        "radon_1day_avg",
+        "b42e01aa-ade7-11e4-89d3-123b93f75cba",
+        "H",
+        "Bq/m3",
+        1.0,
+    ),
+    Sensor(
+        "radon_longterm_avg",
+        "b42e0a4c-ade7-11e4-89d3-123b93f75cba",
+        "H",
+        "Bq/m3",
+        1.0,
+    ),
+)
+
+WAVE_PLUS_SENSORS = (
+    Sensor("humidity", None, None, "%", 1.0 / 2, indx=1),
+    Sensor("radon_1day_avg", None, None, "Bq/m3", 1.0, indx=4),
+    Sensor("radon_longterm_avg", None, None, "Bq/m3", 1.0, indx=5),
+    Sensor("temperature", None, None, "ºC", 1.0 / 100, indx=6),
+    Sensor("pressure", None, None, "hPa", 1.0 / 50, indx=7),
+    Sensor("co2", None, None, "ppm", 1.0, indx=8),
+    Sensor("voc", None, None, "ppb", 1.0, indx=9),
+)
+
+
+class Readings:
+    """One decoded record, with a slot per sensor value.
+
+    Supports the read-only dict operations the entities use, so it can be
+    used where a readings dict was used before.
+    """
+
+    __slots__ = (
+        "humidity",
+        "radon_1day_avg",
+        "radon_longterm_avg",
+        "temperature",
+        "pressure",
+        "co2",
+        "voc",
+    )
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name))
+
+    def __contains__(self, name):
+        return name in self.__slots__ and getattr(self, name) is not None
+
+    def __getitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __len__(self):
+        return sum(1 for name in self.__slots__ if getattr(self, name) is not None)
+
+    def __eq__(self, other):
+        if not isinstance(other, Readings):
+            return NotImplemented
+        return self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        return "Readings({})".format(self.as_dict())
+
+    def get(self, name, default=None):
+        if name not in self:
+            return default
+        return getattr(self, name)
+
+    def items(self):
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is not None:
+                yield name, value
+
+    def as_dict(self):
+        return dict(self.items())
+
+
+class _Plan:
+    """Precomputed mapping from unpacked values to Readings slots.
+
+    Scales of the form 1/n are applied as a true division by n, which gives
+    exactly the same float as round(value * scale, 2) for integer values
+    without the cost of round().
+    """
+
+    def __init__(self, sensors, index):
+        by_name = {sensor.name: sensor for sensor in sensors}
+        self.divided = []
+        self.scaled = []
+        self.absent = []
+        for name in Readings.__slots__:
+            setter = getattr(Readings, name).__set__
+            sensor = by_name.get(name)
+            if sensor is None:
+                self.absent.append(setter)
+                continue
+            divisor = 1.0 / sensor.scale
+            if divisor == round(divisor):
+                self.divided.append((setter, index(sensor), divisor))
+            else:
+                self.scaled.append((setter, index(sensor), sensor.scale))
+
+    def build(self, values):
+        readings = Readings.__new__(Readings)
+        for setter, indx, divisor in self.divided:
+            value = values[indx]
+            setter(readings, None if value is None else value / divisor)
+        for setter, indx, scale in self.scaled:
+            value = values[indx]
+            setter(readings, None if value is None else round(value * scale, 2))
+        for setter in self.absent:
+            setter(readings, None)
+        return readings
+
+
+class WavePlusDecoder:
+    """Decode the single Wave Plus characteristic in one struct call."""
+
+    record = struct.Struct("<BBBBHHHHHHHH")
+
+    def __init__(self, sensors=WAVE_PLUS_SENSORS):
+        self._plan = _Plan(sensors, lambda sensor: sensor.indx)
+
+    def decode(self, raw):
+        values = self.record.unpack(raw)
+        if values[0] != 1:
+            _LOGGER.error("Invalid version, %s", values)
+        return self._plan.build(values)
+
+    def decode_many(self, raws):
+        """Decode a batch of raw records, e.g. captured frames."""
+        data = b"".join(raws)
+        if len(data) != len(raws) * self.record.size:
+            return [self.decode(raw) for raw in raws]
+        build = self._plan.build
+        result = []
+        for values in self.record.iter_unpack(data):
+            if values[0] != 1:
+                _LOGGER.error("Invalid version, %s", values)
+            result.append(build(values))
+        return result
+
+
+class WaveDecoder:
+    """Decode the per characteristic values of the original Wave."""
+
+    def __init__(self, sensors=WAVE_SENSORS):
+        self._fields = tuple(
+            (sensor.uuid, struct.Struct("<" + sensor.format_type))
+            for sensor in sensors
+        )
+        self._plan = _Plan(sensors, sensors.index)
+
+    def decode(self, raw):
+        """Decode a dict of characteristic UUID to raw value."""
+        values = []
+        for uuid, record in self._fields:
+            value = raw.get(uuid)
+            values.append(None if value is None else record.unpack(value)[0])
+        return self._plan.build(values)
+
+    def decode_many(self, raws):
+        return [self.decode(raw) for raw in raws]
+
+
+WAVE_DECODER = WaveDecoder()
+WAVE_PLUS_DECODER = WavePlusDecoder()
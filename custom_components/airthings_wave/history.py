@@ -0,0 +1,112 @@
+"""Bounded history and rolling statistics of Airthings readings."""
+from array import array
+from collections import deque
+
+DEFAULT_HISTORY_SAMPLES = 288
+DEFAULT_HISTORY_WINDOW = 24 * 3600.0
+
+
+class RollingSeries:
+    """Ring buffer of timestamped samples with rolling statistics.
+
+    Samples are kept in two fixed size float arrays, so a series uses
+    16 bytes per sample of `capacity` plus the min/max deques, which hold
+    at most `capacity` sample numbers each. Samples older than `window`
+    seconds, or beyond `capacity`, are dropped. Adding a sample is O(1)
+    amortized, and mean, min, max and rate of change are O(1).
+    """
+
+    def __init__(self, capacity=DEFAULT_HISTORY_SAMPLES, window=DEFAULT_HISTORY_WINDOW):
+        self.capacity = capacity
+        self.window = window
+        self._times = array("d", bytes(8 * capacity))
+        self._values = array("d", bytes(8 * capacity))
+        self._count = 0
+        self._next = 0
+        self._sum = 0.0
+        self._min = deque()
+        self._max = deque()
+
+    def __len__(self):
+        return self._count
+
+    def _value(self, seq):
+        return self._values[seq % self.capacity]
+
+    def _drop_oldest(self):
+        oldest = self._next - self._count
+        self._sum -= self._value(oldest)
+        self._count -= 1
+        if self._min and self._min[0] == oldest:
+            self._min.popleft()
+        if self._max and self._max[0] == oldest:
+            self._max.popleft()
+
+    def add(self, timestamp, value):
+        while self._count and (
+            self._count == self.capacity
+            or self._times[(self._next - self._count) % self.capacity]
+            < timestamp - self.window
+        ):
+            self._drop_oldest()
+        seq = self._next
+        self._times[seq % self.capacity] = timestamp
+        self._values[seq % self.capacity] = value
+        self._next += 1
+        self._count += 1
+        self._sum += value
+        while self._min and self._value(self._min[-1]) >= value:
+            self._min.pop()
+        self._min.append(seq)
+        while self._max and self._value(self._max[-1]) <= value:
+            self._max.pop()
+        self._max.append(seq)
+
+    @property
+    def mean(self):
+        if not self._count:
+            return None
+        return self._sum / self._count
+
+    @property
+    def min(self):
+        if not self._count:
+            return None
+        return self._value(self._min[0])
+
+    @property
+    def max(self):
+        if not self._count:
+            return None
+        return self._value(self._max[0])
+
+    @property
+    def rate_of_change(self):
+        """Change per hour between the oldest and newest sample."""
+        if self._count < 2:
+            return None
+        oldest = (self._next - self._count) % self.capacity
+        newest = (self._next - 1) % self.capacity
+        duration = self._times[newest] - self._times[oldest]
+        if duration <= 0:
+            return None
+        return (self._values[newest] - self._values[oldest]) / duration * 3600
+
+
+class DeviceHistory:
+    """One RollingSeries per sensor of a device."""
+
+    def __init__(self, capacity=DEFAULT_HISTORY_SAMPLES, window=DEFAULT_HISTORY_WINDOW):
+        self.capacity = capacity
+        self.window = window
+        self._series = {}
+
+    def add(self, timestamp, readings):
+        for name, value in readings.items():
+            series = self._series.get(name)
+            if series is None:
+                series = self._series[name] = RollingSeries(self.capacity, self.window)
+            series.add(timestamp, value)
+
+    def get(self, name):
+        return self._series.get(name)
@@ -2,7 +2,12 @@
 import logging
 from datetime import timedelta
 
-from .airthings import AirthingsWave
+from .adaptive import DEFAULT_MAX_INTERVAL, DEFAULT_MIN_INTERVAL, DEFAULT_THRESHOLDS, AdaptiveInterval
+from .adverts import ADVERT_CACHE, DEFAULT_MAX_ADVERT_AGE
+from .airthings import (DEFAULT_ADAPTER, DEFAULT_IDLE_TIMEOUT, AirthingsWave,
+                        HandleCache, get_scheduler)
+from .transport import (DEFAULT_TRANSPORT, BluepyTransport, PygattTransport,
+                        stop_pygatt_backends)
 
 import homeassistant.helpers.config_validation as cv
 import voluptuous as vol
@@ -18,6 +23,7 @@ from homeassistant.const import (ATTR_DEVICE_CLASS, ATTR_ICON, CONF_MAC,
                                  DEVICE_CLASS_TIMESTAMP,
                                  EVENT_HOMEASSISTANT_STOP, ILLUMINANCE)
 from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.event import track_time_interval
 
 _LOGGER = logging.getLogger(__name__)
 SCAN_INTERVAL = timedelta(seconds=300)
@@ -29,6 +35,11 @@ DEVICE_CLASS_ACCELEROMETER = 'accelerometer'
 DEVICE_CLASS_CO2 = 'co2'
 DEVICE_CLASS_VOC = 'voc'
 
+ATTR_ROLLING_MEAN = 'rolling_mean'
+ATTR_ROLLING_MIN = 'rolling_min'
+ATTR_ROLLING_MAX = 'rolling_max'
+ATTR_RATE_OF_CHANGE = 'rate_of_change_per_hour'
+
 ILLUMINANCE_LUX = 'lx'
 PERCENT = '%'
 SPEED_METRIC_UNITS = 'm/s2'
@@ -39,11 +50,42 @@ CO2_METRIC_UNITS = 'ppm'
 VOC_METRIC_UNITS = 'ppb'
 
 DOMAIN = 'airthings'
+DATA_HANDLE_CACHE = 'airthings_handle_cache'
+HANDLE_CACHE_FILE = '.airthings_handles.json'
+
+CONF_ADAPTER = 'adapter'
+CONF_KEEP_CONNECTED = 'keep_connected'
+CONF_IDLE_TIMEOUT = 'idle_timeout'
+CONF_ASYNC_BACKEND = 'async_backend'
+CONF_PASSIVE = 'passive'
+CONF_MAX_ADVERT_AGE = 'max_advert_age'
+CONF_TRANSPORT = 'transport'
+CONF_ADAPTIVE = 'adaptive'
+CONF_MIN_INTERVAL = 'min_interval'
+CONF_MAX_INTERVAL = 'max_interval'
+CONF_THRESHOLDS = 'thresholds'
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
     vol.Optional(CONF_MAC, default=''): cv.string,
     vol.Optional(CONF_SCAN_INTERVAL, default=SCAN_INTERVAL): cv.time_period,
     vol.Optional('plus', default=False): cv.boolean,
+    vol.Optional(CONF_ADAPTER, default=DEFAULT_ADAPTER): cv.positive_int,
+    vol.Optional(CONF_KEEP_CONNECTED, default=False): cv.boolean,
+    vol.Optional(CONF_IDLE_TIMEOUT,
+                 default=timedelta(seconds=DEFAULT_IDLE_TIMEOUT)): cv.time_period,
+    vol.Optional(CONF_ASYNC_BACKEND, default=False): cv.boolean,
+    vol.Optional(CONF_PASSIVE, default=False): cv.boolean,
+    vol.Optional(CONF_MAX_ADVERT_AGE,
+                 default=timedelta(seconds=DEFAULT_MAX_ADVERT_AGE)): cv.time_period,
+    vol.Optional(CONF_TRANSPORT, default=DEFAULT_TRANSPORT):
+        vol.In([BluepyTransport.name, PygattTransport.name]),
+    vol.Optional(CONF_ADAPTIVE, default=False): cv.boolean,
+    vol.Optional(CONF_MIN_INTERVAL,
+                 default=timedelta(seconds=DEFAULT_MIN_INTERVAL)): cv.time_period,
+    vol.Optional(CONF_MAX_INTERVAL,
+                 default=timedelta(seconds=DEFAULT_MAX_INTERVAL)): cv.time_period,
+    vol.Optional(CONF_THRESHOLDS, default={}):
+        {cv.string: vol.All(vol.Coerce(float), vol.Range(min=0))},
 })
 
 DEVICE_SENSOR_SPECIFICS = {"date_time": ('time', None, None),
@@ -63,12 +105,71 @@ def setup_platform(hass, config, add_entities, discovery_info=None):
     """Set up the Airthings sensor."""
     scan_interval = config.get(CONF_SCAN_INTERVAL).total_seconds()
     mac = config.get(CONF_MAC)
-    ha_entities = []
+    adapter = config.get(CONF_ADAPTER)
+    if config.get(CONF_ASYNC_BACKEND) and (config.get(CONF_KEEP_CONNECTED)
+                                           or config.get(CONF_TRANSPORT) != DEFAULT_TRANSPORT):
+        _LOGGER.warning("%s and %s are ignored with %s, bleak reads without them",
+                        CONF_KEEP_CONNECTED, CONF_TRANSPORT, CONF_ASYNC_BACKEND)
+
+    handle_cache = hass.data.get(DATA_HANDLE_CACHE)
+    if handle_cache is None:
+        handle_cache = HandleCache(hass.config.path(HANDLE_CACHE_FILE))
+        hass.data[DATA_HANDLE_CACHE] = handle_cache
+        hass.bus.listen_once(EVENT_HOMEASSISTANT_STOP, lambda event: stop_pygatt_backends())
+
+    if mac:
+        found = {mac: config.get('plus')}
+    else:
+        # No mac configured, add every Airthings found in one scan
+        found = ADVERT_CACHE.discover(get_scheduler(adapter))
+        _LOGGER.info("Found %d Airthings devices: %s", len(found), found)
+
+    for mac, is_plus in found.items():
+        adaptive = None
+        if config.get(CONF_ADAPTIVE):
+            adaptive = AdaptiveInterval(config.get(CONF_MIN_INTERVAL).total_seconds(),
+                                        config.get(CONF_MAX_INTERVAL).total_seconds(),
+                                        {**DEFAULT_THRESHOLDS, **config.get(CONF_THRESHOLDS)})
+        airthings = AirthingsWave(mac, scan_interval, is_plus=is_plus,
+                                  adapter=adapter,
+                                  keep_connected=config.get(CONF_KEEP_CONNECTED),
+                                  idle_timeout=config.get(CONF_IDLE_TIMEOUT).total_seconds(),
+                                  handle_cache=handle_cache,
+                                  passive=config.get(CONF_PASSIVE),
+                                  max_advert_age=config.get(CONF_MAX_ADVERT_AGE).total_seconds(),
+                                  transport=config.get(CONF_TRANSPORT),
+                                  adaptive=adaptive)
+        _setup_device(hass, config, add_entities, airthings)
 
-    airthings = AirthingsWave(mac, scan_interval, is_plus=config.get('plus'))
+
+def _setup_device(hass, config, add_entities, airthings):
+    """Add the entities of one Airthings and start polling it."""
+    mac = airthings.mac
+    ha_entities = []
+    hass.bus.listen_once(EVENT_HOMEASSISTANT_STOP, lambda event: airthings.close())
     for sensor in airthings.sensors:
         ha_entities.append(AirthingsSensor(mac, sensor.name, airthings, DEVICE_SENSOR_SPECIFICS[sensor.name]))
-    add_entities(ha_entities, True)
+
+    # With an adaptive interval the timer ticks at the shortest interval and
+    # the device decides if it is due
+    adaptive = config.get(CONF_ADAPTIVE)
+    interval = config.get(CONF_MIN_INTERVAL) if adaptive else config.get(CONF_SCAN_INTERVAL)
+
+    if config.get(CONF_ASYNC_BACKEND) and airthings.supports_async:
+        async def async_poll(now=None):
+            await airthings.async_poll(force=not adaptive or now is None)
+
+        add_entities(ha_entities)
+        hass.add_job(async_poll())
+        track_time_interval(hass, async_poll, interval)
+        return
+
+    # One read per interval, pushed to all the entities of the device. The
+    # first read runs in the executor so discovery of many devices does not
+    # block setup
+    add_entities(ha_entities)
+    hass.add_job(airthings.poll)
+    track_time_interval(hass, lambda now: airthings.poll(force=not adaptive), interval)
 
 
 class AirthingsSensor(Entity):
@@ -107,15 +208,44 @@ class AirthingsSensor(Entity):
         """Return the unit the value is expressed in."""
         return self._sensor_specifics[0]
 
+    @property
+    def device_state_attributes(self):
+        """Return rolling statistics of the sensor."""
+        series = self.device.history.get(self._name)
+        if series is None or not len(series):
+            return None
+        rate = series.rate_of_change
+        return {
+            ATTR_ROLLING_MEAN: round(series.mean, 2),
+            ATTR_ROLLING_MIN: series.min,
+            ATTR_ROLLING_MAX: series.max,
+            ATTR_RATE_OF_CHANGE: None if rate is None else round(rate, 2),
+        }
+
     @property
     def unique_id(self):
         return '{}-{}'.format(self._mac, self._name)
 
+    @property
+    def should_poll(self):
+        """Readings are pushed by the device."""
+        return False
+
+    async def async_added_to_hass(self):
+        """Subscribe to readings from the device."""
+        self.async_on_remove(self.device.subscribe(self._handle_readings))
+        # The first read may have finished before the subscription
+        self.update()
+
+    def _handle_readings(self, readings):
+        if self._name not in readings:
+            return
+        self._state = readings[self._name]
+        self.schedule_update_ha_state()
+
     def update(self):
-        """Fetch new state data for the sensor.
-        This is the only method that should fetch new data for Home Assistant.
-        """
-        readings = self.device.get_readings()
+        """Take the state from the latest readings of the device."""
+        readings = self.device.readings
         if self._name not in readings:
             return
         self._state = readings[self._name]
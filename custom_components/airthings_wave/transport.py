@@ -0,0 +1,243 @@
+"""BLE transports used to read Airthings devices.
+
+A transport owns the connection to one device and reads characteristics
+by handle. Decoding, retries, handle caching and scheduling are done once
+in AirthingsWave for all transports.
+"""
+import logging
+import threading
+
+try:
+    import bluepy
+except ImportError:
+    bluepy = None
+
+try:
+    import pygatt
+    from pygatt.exceptions import BLEError, NotConnectedError, NotificationTimeout
+except ImportError:
+    pygatt = None
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_TRANSPORT = "bluepy"
+
+
+class Transport:
+    """Connection to one device."""
+
+    name = None
+    errors = ()
+
+    def __init__(self, mac, adapter):
+        self._mac = mac
+        self._adapter = adapter
+
+    def is_connected(self):
+        raise NotImplementedError
+
+    def connect(self, timeout):
+        raise NotImplementedError
+
+    def disconnect(self):
+        raise NotImplementedError
+
+    def discover(self, uuid):
+        """Return the value handle of a readable characteristic, or None."""
+        raise NotImplementedError
+
+    def read_handle(self, handle):
+        raise NotImplementedError
+
+
+class BluepyTransport(Transport):
+    name = "bluepy"
+    errors = (bluepy.btle.BTLEException,) if bluepy is not None else ()
+
+    def __init__(self, mac, adapter):
+        super().__init__(mac, adapter)
+        self._peripheral = None
+
+    def is_connected(self):
+        try:
+            return self._peripheral.getState() == "conn"
+        except Exception:
+            return False
+
+    def connect(self, timeout):
+        _LOGGER.debug("Connecting to Airthings...")
+        try:
+            self._peripheral = bluepy.btle.Peripheral(self._mac, iface=self._adapter, timeout=timeout)
+        except bluepy.btle.BTLEException:
+            _LOGGER.debug("Failed connecting to Airthings.", exc_info=True)
+            self._peripheral = None
+            raise
+        _LOGGER.debug("Connected to Airthings.")
+
+    def disconnect(self):
+        if self._peripheral is None:
+            return
+        _LOGGER.debug("Disconnecting")
+        try:
+            self._peripheral.disconnect()
+        except bluepy.btle.BTLEException:
+            _LOGGER.warning("Error disconnecting from Airthings.", exc_info=True)
+        finally:
+            self._peripheral = None
+
+    def discover(self, uuid):
+        char = self._peripheral.getCharacteristics(uuid=uuid)[0]
+        if not char.supportsRead():
+            return None
+        return char.getHandle()
+
+    def read_handle(self, handle):
+        return self._peripheral.readCharacteristic(handle)
+
+
+_PYGATT_BACKENDS = {}
+# A gatttool backend holds one connection; the mac it is connected to, per adapter
+_PYGATT_CONNECTED = {}
+_PYGATT_LOCK = threading.Lock()
+
+
+def _pygatt_backend(adapter):
+    """Return the started gatttool backend of an adapter.
+
+    The backend is started once and shared by all devices on the adapter.
+    """
+    with _PYGATT_LOCK:
+        backend = _PYGATT_BACKENDS.get(adapter)
+        if backend is None:
+            backend = pygatt.backends.GATTToolBackend(hci_device="hci{}".format(adapter))
+            backend.start(reset_on_start=False)
+            _PYGATT_BACKENDS[adapter] = backend
+        return backend
+
+
+def stop_pygatt_backends():
+    with _PYGATT_LOCK:
+        for backend in _PYGATT_BACKENDS.values():
+            backend.stop()
+        _PYGATT_BACKENDS.clear()
+        _PYGATT_CONNECTED.clear()
+
+
+class PygattTransport(Transport):
+    name = "pygatt"
+    errors = (
+        (BLEError, NotConnectedError, NotificationTimeout) if pygatt is not None else ()
+    )
+
+    def __init__(self, mac, adapter):
+        super().__init__(mac, adapter)
+        self._device = None
+
+    def _owns_backend(self):
+        return _PYGATT_CONNECTED.get(self._adapter) == self._mac
+
+    def is_connected(self):
+        """Return True if the shared backend is still connected to this device.
+
+        Connecting another device on the adapter replaces the connection.
+        """
+        return self._device is not None and self._owns_backend()
+
+    def connect(self, timeout):
+        _LOGGER.debug("Connecting to Airthings...")
+        self._device = None
+        self._device = _pygatt_backend(self._adapter).connect(self._mac, timeout)
+        _PYGATT_CONNECTED[self._adapter] = self._mac
+        _LOGGER.debug("Connected to Airthings.")
+
+    def disconnect(self):
+        if self._device is None:
+            return
+        if not self._owns_backend():
+            # The connection was already replaced by another device
+            self._device = None
+            return
+        _LOGGER.debug("Disconnecting")
+        _PYGATT_CONNECTED.pop(self._adapter, None)
+        try:
+            self._device.disconnect()
+        except self.errors:
+            _LOGGER.warning("Error disconnecting from Airthings.", exc_info=True)
+        finally:
+            self._device = None
+
+    def discover(self, uuid):
+        return self._device.get_handle(uuid)
+
+    def read_handle(self, handle):
+        return self._device.char_read_handle(handle)
+
+
+class FakeTransportError(Exception):
+    """Error raised by FakeTransport."""
+
+
+class FakeTransport(Transport):
+    """In-memory device, for tests and for benchmarking the pipeline.
+
+    `values` maps characteristic UUID to the raw value. `latency` seconds
+    are slept per round-trip, and the next `fail` round-trips raise
+    FakeTransportError. Like a real link, a disconnect from another thread
+    makes a round-trip in progress fail.
+    """
+
+    name = "fake"
+    errors = (FakeTransportError,)
+
+    def __init__(self, mac, adapter, values=None, latency=0.0):
+        super().__init__(mac, adapter)
+        self.values = dict(values or {})
+        self.latency = latency
+        self.fail = 0
+        self.connected = False
+        self.round_trips = 0
+        self._handles = {}
+        self._dropped = threading.Event()
+
+    def _round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            self._dropped.wait(self.latency)
+        if self._dropped.is_set():
+            raise FakeTransportError("Disconnected")
+        if self.fail:
+            self.fail -= 1
+            self.connected = False
+            raise FakeTransportError("Simulated failure")
+
+    def is_connected(self):
+        return self.connected
+
+    def connect(self, timeout):
+        self._dropped.clear()
+        self._round_trip()
+        self.connected = True
+
+    def disconnect(self):
+        self.connected = False
+        self._dropped.set()
+
+    def discover(self, uuid):
+        self._round_trip()
+        if uuid not in self.values:
+            return None
+        return self._handles.setdefault(uuid, len(self._handles) + 1)
+
+    def read_handle(self, handle):
+        self._round_trip()
+        for uuid, value_handle in self._handles.items():
+            if value_handle == handle:
+                return self.values[uuid]
+        raise FakeTransportError("Invalid handle {}".format(handle))
+
+
+TRANSPORTS = {
+    BluepyTransport.name: BluepyTransport,
+    PygattTransport.name: PygattTransport,
+    FakeTransport.name: FakeTransport,
+}
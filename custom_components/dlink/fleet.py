@@ -0,0 +1,85 @@
+"""Poll many D-Link plugs from one bounded worker pool."""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import math
+import threading
+
+from homeassistant.helpers.event import track_time_interval
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 4
+# Number of poll durations kept for the percentiles
+DEFAULT_LATENCY_SAMPLES = 1000
+
+
+def percentile(values, fraction):
+    """Return the nearest-rank percentile of sorted `values`."""
+    if not values:
+        return None
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+class PlugFleet:
+    """Poll plugs one at a time, spread evenly over the scan interval.
+
+    All requests to the plugs run in one pool of `max_workers` threads, so
+    dozens of plugs never hold more threads than that. The poll durations of
+    all plugs are collected for fleet-wide percentiles.
+    """
+
+    def __init__(self, hass, max_workers=DEFAULT_MAX_WORKERS, latency_samples=DEFAULT_LATENCY_SAMPLES):
+        self._hass = hass
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.plugs = []
+        self._next = 0
+        self._durations = deque(maxlen=latency_samples)
+        self._polls_recorded = {}
+        self._recorded = 0
+        self._lock = threading.Lock()
+
+    def add(self, data):
+        """Add a SmartPlugData to the fleet."""
+        self.plugs.append(data)
+        data.subscribe(lambda: self._record(data))
+
+    def start(self, scan_interval):
+        """Poll the first plug now, then the next one every scan_interval / len(plugs).
+
+        The first polls are staggered like all later ones, so a restart does
+        not send a request to every plug at once.
+        """
+        if not self.plugs:
+            return
+        self.tick()
+        track_time_interval(self._hass, self.tick, scan_interval / len(self.plugs))
+
+    def tick(self, now=None):
+        """Start a poll of the next plug."""
+        data = self.plugs[self._next]
+        self._next = (self._next + 1) % len(self.plugs)
+        data.update()
+
+    def _record(self, data):
+        # Listeners are also called on state changes, which are not polls
+        if self._polls_recorded.get(id(data), 0) == data.polls:
+            return
+        self._polls_recorded[id(data)] = data.polls
+        with self._lock:
+            self._durations.append(data.last_poll_duration)
+            # Not len(self._durations), which stops growing at latency_samples
+            self._recorded += 1
+            recorded = self._recorded
+        if recorded % len(self.plugs) == 0:
+            _LOGGER.debug("D-Link poll latency: %s", self.latency_percentiles())
+
+    def latency_percentiles(self):
+        """Return the p50, p90 and p99 poll durations in seconds."""
+        with self._lock:
+            durations = sorted(self._durations)
+        return {
+            "p50": percentile(durations, 0.5),
+            "p90": percentile(durations, 0.9),
+            "p99": percentile(durations, 0.99),
+        }
@@ -0,0 +1,52 @@
+"""Backoff for D-Link plugs that do not answer."""
+import time
+
+# Seconds to skip a host after its first failure, doubled for every failure
+DEFAULT_BACKOFF = 60
+DEFAULT_MAX_BACKOFF = 30 * 60
+
+
+class HostHealth:
+    """Exponential backoff for one host, on a monotonic clock.
+
+    After a failure the host is skipped for `base_delay` seconds, doubled for
+    every further failure up to `max_delay`. When the delay has passed the
+    host is half-open: it should be probed cheaply before it is polled.
+    """
+
+    def __init__(self, base_delay=DEFAULT_BACKOFF, max_delay=DEFAULT_MAX_BACKOFF, clock=time.monotonic):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._clock = clock
+        self.failures = 0
+        self._retry_at = 0.0
+
+    @property
+    def healthy(self):
+        return self.failures == 0
+
+    @property
+    def half_open(self):
+        """Return True if the host failed and its backoff has passed."""
+        return self.failures > 0 and self._clock() >= self._retry_at
+
+    def allow(self):
+        """Return True if the host may be tried now."""
+        return self.failures == 0 or self._clock() >= self._retry_at
+
+    def retry_in(self):
+        """Return the seconds until the host may be tried again."""
+        return max(0.0, self._retry_at - self._clock())
+
+    def failed(self):
+        """Record a failure and return the backoff in seconds."""
+        self.failures += 1
+        delay = min(self.max_delay, self.base_delay * 2 ** (self.failures - 1))
+        self._retry_at = self._clock() + delay
+        return delay
+
+    def succeeded(self):
+        """Record a success and return True if the host was failing."""
+        recovered = self.failures > 0
+        self.failures = 0
+        return recovered
@@ -0,0 +1,128 @@
+"""HNAP client for D-Link smart plugs that keeps its login between requests."""
+import hashlib
+import hmac
+import logging
+import socket
+import time
+import urllib.parse
+import xml.etree.ElementTree as ET
+
+from pyW215.pyW215 import SmartPlug
+import requests
+
+_LOGGER = logging.getLogger(__name__)
+
+HNAP_NS = "{http://purenetworks.com/HNAP1/}"
+HNAP_ACTION = '"http://purenetworks.com/HNAP1/{}"'
+CONTENT_TYPE = '"text/xml; charset=utf-8"'
+
+# (connect, read) timeout in seconds
+DEFAULT_TIMEOUT = (2, 5)
+# Timeout in seconds of the TCP connect that checks if a plug is reachable
+PROBE_TIMEOUT = 1
+
+
+class SessionSmartPlug(SmartPlug):
+    """SmartPlug that reuses its login and HTTP connection.
+
+    pyW215 logs in again before every action, which costs two extra
+    exchanges each time. Here the login is kept until the plug rejects it,
+    and all requests go over one keep-alive connection. The HNAP API of the
+    plug has no way to ask for several modules in one action, so a poll of
+    state and consumption is three exchanges.
+    """
+
+    def __init__(self, ip, password, user="admin", use_legacy_protocol=False):
+        self._session = requests.Session()
+        self.exchanges = 0
+        self.logins = 0
+        super().__init__(ip, password, user, use_legacy_protocol)
+
+    def _post(self, payload, headers):
+        """POST to the HNAP endpoint and return the parsed response."""
+        self.exchanges += 1
+        response = self._session.post(self.url, data=payload, headers=headers, timeout=DEFAULT_TIMEOUT)
+        response.raise_for_status()
+        return ET.fromstring(response.content)
+
+    def reachable(self, timeout=PROBE_TIMEOUT):
+        """Return True if a TCP connection to the plug can be opened."""
+        url = urllib.parse.urlsplit(self.url)
+        try:
+            socket.create_connection((url.hostname, url.port or 80), timeout).close()
+        except OSError:
+            return False
+        return True
+
+    def auth(self):
+        """Log in and return (private key, cookie), or None.
+
+        Failing plugs are probed with reachable() by the caller, before the
+        login is tried.
+        """
+        self.logins += 1
+        headers = {"Content-Type": CONTENT_TYPE, "SOAPAction": HNAP_ACTION.format("Login")}
+        try:
+            root = self._post(self.initial_auth_payload(), headers)
+            challenge = root.find(".//" + HNAP_NS + "Challenge")
+            cookie = root.find(".//" + HNAP_NS + "Cookie")
+            public_key = root.find(".//" + HNAP_NS + "PublicKey")
+            if challenge is None or cookie is None or public_key is None:
+                _LOGGER.warning("Failed to receive initial authentication from %s", self.ip)
+                return None
+
+            private_key = hmac.new((public_key.text + self.password).encode(), challenge.text.encode(),
+                                   digestmod=hashlib.md5).hexdigest().upper()
+            login_pwd = hmac.new(private_key.encode(), challenge.text.encode(),
+                                 digestmod=hashlib.md5).hexdigest().upper()
+            headers["HNAP_AUTH"] = '"{}"'.format(private_key)
+            headers["Cookie"] = "uid={}".format(cookie.text)
+            root = self._post(self.auth_payload(login_pwd), headers)
+        except (requests.RequestException, ET.ParseError):
+            _LOGGER.debug("Unable to open a connection to dlink switch %s", self.ip)
+            return None
+
+        login_result = root.find(".//" + HNAP_NS + "LoginResult")
+        if login_result is None or (login_result.text or "").lower() != "success":
+            _LOGGER.error("Failed to authenticate with SmartPlug %s", self.ip)
+            return None
+        return private_key, cookie.text
+
+    def SOAPAction(self, Action, responseElement, params="", recursive=False):
+        """Perform `Action` and return the text of `responseElement`, or None.
+
+        If the kept login is rejected, logs in again and retries once.
+        """
+        if self.authenticated is None:
+            self.authenticated = self.auth()
+            if self.authenticated is None:
+                return None
+        private_key, cookie = self.authenticated
+
+        # Same timestamp as pyW215 sends
+        time_stamp = str(round(time.time() / 1e6))
+        action_url = HNAP_ACTION.format(Action)
+        auth_key = hmac.new(private_key.encode(), (time_stamp + action_url).encode(),
+                            digestmod=hashlib.md5).hexdigest().upper()
+        headers = {"Content-Type": CONTENT_TYPE,
+                   "SOAPAction": action_url,
+                   "HNAP_AUTH": "{} {}".format(auth_key, time_stamp),
+                   "Cookie": "uid={}".format(cookie)}
+        try:
+            root = self._post(self.requestBody(Action, params).encode(), headers)
+        except (requests.ConnectionError, requests.Timeout):
+            # A new login would not help
+            _LOGGER.debug("No answer from %s", self.ip)
+            return None
+        except (requests.RequestException, ET.ParseError):
+            root = None
+        element = None if root is None else root.find(".//" + HNAP_NS + responseElement)
+        if element is not None and element.text is not None:
+            return element.text
+
+        # The login may have expired
+        self.authenticated = None
+        if not recursive:
+            return self.SOAPAction(Action, responseElement, params, True)
+        _LOGGER.warning("Failed to get %s from %s", responseElement, self.ip)
+        return None
@@ -1,61 +1,105 @@
 """Support for D-Link W215 smart switch."""
+from collections import deque
 from datetime import timedelta
 import logging
-import urllib
+import threading
 import time
 
-from pyW215.pyW215 import SmartPlug
 import voluptuous as vol
 
 from homeassistant.components.switch import PLATFORM_SCHEMA, SwitchEntity
 from homeassistant.const import (
     ATTR_TEMPERATURE,
     CONF_HOST,
+    CONF_HOSTS,
     CONF_NAME,
     CONF_PASSWORD,
     CONF_USERNAME,
     TEMP_CELSIUS,
 )
 import homeassistant.helpers.config_validation as cv
-from homeassistant.util import dt as dt_util
+from homeassistant.helpers.event import call_later
+
+from .fleet import DEFAULT_MAX_WORKERS, PlugFleet
+from .health import HostHealth
+from .hnap import SessionSmartPlug
 
 _LOGGER = logging.getLogger(__name__)
 
 ATTR_TOTAL_CONSUMPTION = "total_consumption"
+ATTR_POLL_DURATION = "poll_duration"
 
 CONF_USE_LEGACY_PROTOCOL = "use_legacy_protocol"
+CONF_MAX_WORKERS = "max_workers"
 
 DEFAULT_NAME = "D-Link Smart Plug W215"
 DEFAULT_PASSWORD = ""
 DEFAULT_USERNAME = "admin"
+# Seconds the plug needs between two requests
+DEFAULT_REQUEST_SPACING = 1.5
 
 SCAN_INTERVAL = timedelta(minutes=3
                           )
 
-PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
+HOST_SCHEMA = vol.Schema(
     {
         vol.Required(CONF_HOST): cv.string,
-        vol.Required(CONF_PASSWORD, default=DEFAULT_PASSWORD): cv.string,
-        vol.Required(CONF_USERNAME, default=DEFAULT_USERNAME): cv.string,
-        vol.Optional(CONF_NAME, default=DEFAULT_NAME): cv.string,
-        vol.Optional(CONF_USE_LEGACY_PROTOCOL, default=False): cv.boolean,
+        vol.Optional(CONF_NAME): cv.string,
+        vol.Optional(CONF_PASSWORD): cv.string,
+        vol.Optional(CONF_USERNAME): cv.string,
+        vol.Optional(CONF_USE_LEGACY_PROTOCOL): cv.boolean,
     }
 )
 
+PLATFORM_SCHEMA = vol.All(
+    PLATFORM_SCHEMA.extend(
+        {
+            vol.Optional(CONF_HOST): cv.string,
+            vol.Optional(CONF_HOSTS): vol.All(cv.ensure_list, [HOST_SCHEMA]),
+            vol.Required(CONF_PASSWORD, default=DEFAULT_PASSWORD): cv.string,
+            vol.Required(CONF_USERNAME, default=DEFAULT_USERNAME): cv.string,
+            vol.Optional(CONF_NAME, default=DEFAULT_NAME): cv.string,
+            vol.Optional(CONF_USE_LEGACY_PROTOCOL, default=False): cv.boolean,
+            vol.Optional(CONF_MAX_WORKERS, default=DEFAULT_MAX_WORKERS): cv.positive_int,
+        }
+    ),
+    cv.has_at_least_one_key(CONF_HOST, CONF_HOSTS),
+)
 
-def setup_platform(hass, config, add_entities, discovery_info=None):
-    """Set up a D-Link Smart Plug."""
-
-    host = config.get(CONF_HOST)
-    username = config.get(CONF_USERNAME)
-    password = config.get(CONF_PASSWORD)
-    use_legacy_protocol = config.get(CONF_USE_LEGACY_PROTOCOL)
-    name = config.get(CONF_NAME)
-
-    smartplug = SmartPlug(host, password, username, use_legacy_protocol)
-    data = SmartPlugData(smartplug)
 
-    add_entities([SmartPlugSwitch(hass, data, name)], True)
+def setup_platform(hass, config, add_entities, discovery_info=None):
+    """Set up D-Link Smart Plugs.
+
+    Either one `host`, or a list of `hosts` that are polled as a fleet. The
+    username, password and protocol of the platform are the defaults of
+    every host.
+    """
+    if CONF_HOSTS in config:
+        hosts = config[CONF_HOSTS]
+    else:
+        hosts = [{CONF_HOST: config[CONF_HOST], CONF_NAME: config[CONF_NAME]}]
+
+    fleet = PlugFleet(hass, config[CONF_MAX_WORKERS])
+
+    def connect(host_config):
+        return SessionSmartPlug(
+            host_config[CONF_HOST],
+            host_config.get(CONF_PASSWORD, config[CONF_PASSWORD]),
+            host_config.get(CONF_USERNAME, config[CONF_USERNAME]),
+            host_config.get(CONF_USE_LEGACY_PROTOCOL, config[CONF_USE_LEGACY_PROTOCOL]),
+        )
+
+    # Creating a SmartPlug makes a request, so connect to the plugs in parallel
+    entities = []
+    for host_config, smartplug in zip(hosts, fleet.executor.map(connect, hosts)):
+        data = SmartPlugData(hass, smartplug, executor=fleet.executor)
+        fleet.add(data)
+        name = host_config.get(CONF_NAME, "{} {}".format(DEFAULT_NAME, host_config[CONF_HOST]))
+        entities.append(SmartPlugSwitch(hass, data, name))
+
+    # The polls run in the background and are pushed to the entities when done
+    add_entities(entities)
+    fleet.start(SCAN_INTERVAL)
 
 
 class SmartPlugSwitch(SwitchEntity):
@@ -89,6 +133,7 @@ class SmartPlugSwitch(SwitchEntity):
         attrs = {
             ATTR_TOTAL_CONSUMPTION: total_consumption,
             ATTR_TEMPERATURE: temperature,
+            ATTR_POLL_DURATION: self.data.last_poll_duration,
         }
 
         return attrs
@@ -108,15 +153,20 @@ class SmartPlugSwitch(SwitchEntity):
 
     def turn_on(self, **kwargs):
         """Turn the switch on."""
-        self.data.smartplug.state = "ON"
+        self.data.set_state("ON")
 
     def turn_off(self, **kwargs):
         """Turn the switch off."""
-        self.data.smartplug.state = "OFF"
+        self.data.set_state("OFF")
 
-    def update(self):
-        """Get the latest data from the smart plug and updates the states."""
-        self.data.update()
+    @property
+    def should_poll(self):
+        """The data is pushed by the plug."""
+        return False
+
+    async def async_added_to_hass(self):
+        """Subscribe to changes of the plug."""
+        self.async_on_remove(self.data.subscribe(self.schedule_update_ha_state))
 
     @property
     def available(self) -> bool:
@@ -124,48 +174,219 @@ class SmartPlugSwitch(SwitchEntity):
         return self.data.available
 
 
+class RequestPacer:
+    """Run the requests to one plug in order, at least `spacing` seconds apart.
+
+    The wait between requests is a call_later timer, not a sleep, so no
+    executor thread is held while waiting and other plugs keep polling.
+    Commands run before any queued poll request, and in the Home Assistant
+    executor instead of the shared `executor`, so they do not wait for the
+    polls of other plugs either.
+    """
+
+    def __init__(self, hass, spacing=DEFAULT_REQUEST_SPACING, executor=None):
+        self._hass = hass
+        self.spacing = spacing
+        self._executor = executor
+        self._queue = deque()
+        self._commands = deque()
+        self._lock = threading.Lock()
+        self._running = False
+        self._next_request = 0.0
+
+    def submit(self, job, command=False):
+        """Queue `job` to run in an executor thread when the plug is ready."""
+        with self._lock:
+            (self._commands if command else self._queue).append(job)
+            if self._running:
+                return
+            self._running = True
+        self._schedule()
+
+    def _schedule(self):
+        delay = self._next_request - time.monotonic()
+        if delay > 0:
+            call_later(self._hass, delay, lambda now: self._start())
+        else:
+            self._start()
+
+    def _start(self):
+        if self._executor is None or self._commands:
+            self._hass.add_job(self._run_next)
+        else:
+            self._executor.submit(self._run_next, True)
+
+    def _run_next(self, pooled=False):
+        with self._lock:
+            # A command that arrived while this waited in the busy pool is
+            # handed to the Home Assistant executor instead
+            handoff = pooled and bool(self._commands)
+            if not handoff:
+                job = (self._commands or self._queue).popleft()
+        if handoff:
+            self._hass.add_job(self._run_next)
+            return
+        try:
+            job()
+        finally:
+            self._next_request = time.monotonic() + self.spacing
+            with self._lock:
+                running = self._running = bool(self._commands or self._queue)
+            if running:
+                self._schedule()
+
+
 class SmartPlugData:
     """Get the latest data from smart plug."""
 
-    def __init__(self, smartplug):
+    def __init__(self, hass, smartplug, spacing=DEFAULT_REQUEST_SPACING, executor=None):
         """Initialize the data object."""
         self.smartplug = smartplug
+        self.pacer = RequestPacer(hass, spacing, executor)
         self.state = None
         self.temperature = None
         self.current_consumption = None
         self.total_consumption = None
         self.available = False
-        self._n_tried = 0
-        self._last_tried = None
+        self.health = HostHealth()
+        self._listeners = []
+        self._commands_pending = 0
+        self._commands_lock = threading.Lock()
+        self._poll_started = None
+        self.last_poll_duration = None
+        self.total_poll_duration = 0.0
+        self.polls = 0
+
+    @property
+    def mean_poll_duration(self):
+        return self.total_poll_duration / self.polls if self.polls else None
+
+    def subscribe(self, listener):
+        """Call `listener` after every completed poll and state change.
+
+        The returned function unsubscribes it.
+        """
+        self._listeners.append(listener)
+        return lambda: self._listeners.remove(listener)
 
     def update(self):
-        """Get the latest data from the smart plug."""
-        if self._last_tried is not None:
-            last_try_s = (dt_util.now() - self._last_tried).total_seconds() / 60
-            retry_seconds = min(self._n_tried * 2, 10) - last_try_s
-            if self._n_tried > 0 and retry_seconds > 0:
-                _LOGGER.warning("Waiting %s s to retry", retry_seconds)
-                return
+        """Start a poll of the smart plug and return at once.
 
-        _state = "unknown"
+        The requests are spaced by the pacer and the listeners are called
+        when the last one is done. Nothing happens if a poll is running.
+        """
+        if self._poll_started is not None:
+            return
+        if not self.health.allow():
+            _LOGGER.debug("Skipping %s for %.0f s", self.smartplug.ip, self.health.retry_in())
+            return
 
+        self._poll_started = time.monotonic()
+        self._run_steps([self._read_state, self._read_current_consumption, self._read_total_consumption])
+
+    def _run_steps(self, steps):
+        """Queue the first step, which queues the next one if it returns True."""
+        step = steps.pop(0)
+
+        def run():
+            try:
+                more = step()
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Error polling D-Link switch")
+                self._failed()
+                more = False
+            if more and steps:
+                self._run_steps(steps)
+            else:
+                self._finish_poll()
+
+        self.pacer.submit(run)
+
+    def set_state(self, value):
+        """Switch the plug on or off.
+
+        The new state is shown at once. The command is sent ahead of any
+        queued poll, followed by a read of only the relay state to confirm it.
+        """
+        with self._commands_lock:
+            self._commands_pending += 1
+        self.state = value
+        self._notify()
+        self.pacer.submit(lambda: self._send_state(value), command=True)
+        self.pacer.submit(self._confirm_state, command=True)
+
+    def _send_state(self, value):
         try:
-            self._last_tried = dt_util.now()
-            _state = self.smartplug.state
-        except urllib.error.HTTPError:
-            _LOGGER.error("D-Link connection problem")
-        if _state == "unknown":
-            self._n_tried += 1
-            self.available = False
-            _LOGGER.warning("Failed to connect to D-Link switch")
+            self.smartplug.state = value
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("Error switching D-Link switch")
+
+    def _confirm_state(self):
+        try:
+            state = self.smartplug.state
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("Error reading D-Link switch")
+            state = "unknown"
+        with self._commands_lock:
+            self._commands_pending -= 1
+            pending = self._commands_pending
+        if pending:
+            # A later command is queued and will confirm its own state
             return
+        if state == "unknown":
+            # Keep the optimistic state until the next poll
+            return
+        if state != self.state:
+            _LOGGER.warning("D-Link switch %s is %s after switching", self.smartplug.ip, state)
+        self.state = state
+        self._notify()
+
+    def _notify(self):
+        for listener in list(self._listeners):
+            listener()
+
+    def _finish_poll(self):
+        duration = time.monotonic() - self._poll_started
+        self.last_poll_duration = round(duration, 2)
+        self.total_poll_duration += duration
+        self.polls += 1
+        self._poll_started = None
+        _LOGGER.debug("Polled %s in %.2f s", self.smartplug.ip, duration)
+        self._notify()
+
+    def _failed(self):
+        self.available = False
+        delay = self.health.failed()
+        if self.health.failures == 1:
+            _LOGGER.warning("D-Link switch %s is unavailable, retrying in %d s", self.smartplug.ip, delay)
+        else:
+            _LOGGER.debug("D-Link switch %s is still unavailable, retrying in %d s", self.smartplug.ip, delay)
+
+    def _read_state(self):
+        # Probe a failing plug with a TCP connect before the SOAP requests
+        if self.health.half_open and not self.smartplug.reachable():
+            self._failed()
+            return False
+
+        _state = self.smartplug.state
+        if _state == "unknown":
+            self._failed()
+            return False
 
-        self.state = _state
+        if not self._commands_pending:
+            # Otherwise this may be the state from before the command
+            self.state = _state
         self.available = True
 
         # self.temperature = self.smartplug.temperature
-        time.sleep(1.5)
+        return True
+
+    def _read_current_consumption(self):
         self.current_consumption = self.smartplug.current_consumption
-        time.sleep(1.5)
+        return True
+
+    def _read_total_consumption(self):
         self.total_consumption = self.smartplug.total_consumption
-        self._n_tried = 0
+        if self.health.succeeded():
+            _LOGGER.info("D-Link switch %s is available again", self.smartplug.ip)
+        return True
@@ -1,23 +1,38 @@
 import urllib.parse
 import requests
+import codecs
 import json
-from datetime import date
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from datetime import timedelta
 import logging
 import homeassistant.helpers.config_validation as cv
+from homeassistant.const import CONF_NAME
+from homeassistant.helpers.event import track_point_in_time, track_time_change
+import homeassistant.util.dt as dt_util
 import voluptuous as vol
 
+from .client import MinRenovasjonClient
+
 _LOGGER = logging.getLogger(__name__)
 
 DOMAIN = "min_renovasjon"
 DATA_MIN_RENOVASJON = "data_min_renovasjon"
+DATA_MIN_RENOVASJON_HUB = "data_min_renovasjon_hub"
 
 CONF_STREET_NAME = "street_name"
 CONF_STREET_CODE = "street_code"
 CONF_HOUSE_NO = "house_no"
 CONF_COUNTY_ID = "county_id"
 CONF_DATE_FORMAT = "date_format"
+CONF_ADDRESSES = "addresses"
+CONF_MAX_CONCURRENT = "max_concurrent"
 DEFAULT_DATE_FORMAT = "%d/%m/%Y"
+DEFAULT_MAX_CONCURRENT = 4
 
 CONST_KOMMUNE_NUMMER = "Kommunenr"
 CONST_APP_KEY = "RenovasjonAppKey"
@@ -26,39 +41,256 @@ CONST_URL_TOMMEKALENDER = 'https://komteksky.norkart.no/komtek.renovasjonwebapi/
                           'gatenavn=[gatenavn]&gatekode=[gatekode]&husnr=[husnr]'
 CONST_APP_KEY_VALUE = "AE13DEEC-804F-4615-A74E-B4FAC11F0A30"
 
+CHUNK_SIZE = 64 * 1024
+_JSON_SEPARATORS = re.compile(r"[\s,]*")
+
+CACHE_FILE = ".min_renovasjon.json"
+FRAKSJONER_TTL = 7 * 24 * 3600
+# Used when the calendar could not be loaded or the server returns passed dates
+RETRY_INTERVAL = timedelta(hours=1)
+
+ADDRESS_SCHEMA = {
+    vol.Required(CONF_STREET_NAME): cv.string,
+    vol.Required(CONF_STREET_CODE): cv.string,
+    vol.Required(CONF_HOUSE_NO): cv.string,
+    vol.Required(CONF_COUNTY_ID): cv.string,
+}
+
 CONFIG_SCHEMA = vol.Schema({
-    DOMAIN: vol.Schema({
-        vol.Required(CONF_STREET_NAME): cv.string,
-        vol.Required(CONF_STREET_CODE): cv.string,
-        vol.Required(CONF_HOUSE_NO): cv.string,
-        vol.Required(CONF_COUNTY_ID): cv.string,
-        vol.Optional(CONF_DATE_FORMAT, default=DEFAULT_DATE_FORMAT): cv.string,
-    })
+    DOMAIN: vol.Any(
+        vol.Schema({
+            **ADDRESS_SCHEMA,
+            vol.Optional(CONF_DATE_FORMAT, default=DEFAULT_DATE_FORMAT): cv.string,
+        }),
+        vol.Schema({
+            vol.Required(CONF_ADDRESSES): vol.All(cv.ensure_list, [vol.Schema({
+                vol.Required(CONF_NAME): cv.string,
+                **ADDRESS_SCHEMA,
+            })]),
+            vol.Optional(CONF_DATE_FORMAT, default=DEFAULT_DATE_FORMAT): cv.string,
+            vol.Optional(CONF_MAX_CONCURRENT, default=DEFAULT_MAX_CONCURRENT): cv.positive_int,
+        }),
+    )
 }, extra=vol.ALLOW_EXTRA)
 
 
+class CalendarEntry:
+    """Pickup dates of one fraction."""
+
+    __slots__ = ("fraksjon_id", "navn", "ikon", "tommedato_forste", "tommedato_neste",
+                 "formatted", "days_until")
+
+    def __init__(self, fraksjon_id, navn, ikon, tommedato_forste, tommedato_neste):
+        self.fraksjon_id = fraksjon_id
+        self.navn = navn
+        self.ikon = ikon
+        self.tommedato_forste = tommedato_forste
+        self.tommedato_neste = tommedato_neste
+        self.formatted = None
+        self.days_until = None
+
+    def update(self, other):
+        for name in self.__slots__:
+            setattr(self, name, getattr(other, name))
+
+    def format(self, date_format):
+        """Precompute the display string of the first pickup date."""
+        if self.tommedato_forste is None or date_format == "None":
+            self.formatted = self.tommedato_forste
+        else:
+            self.formatted = self.tommedato_forste.strftime(date_format)
+
+    def count_days(self, today):
+        """Precompute the number of days from `today` to the first pickup date."""
+        if self.tommedato_forste is None:
+            self.days_until = None
+        else:
+            self.days_until = (self.tommedato_forste.date() - today).days
+
+
+def _iter_json_array(chunks):
+    """Yield the items of a JSON array read from an iterable of byte chunks.
+
+    Only one item is decoded at a time, so neither the whole document nor
+    the whole parsed tree is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    pos = 0
+    started = False
+    for chunk in chunks:
+        buf = buf[pos:] + utf8.decode(chunk)
+        pos = 0
+        while True:
+            pos = _JSON_SEPARATORS.match(buf, pos).end()
+            if pos == len(buf):
+                break
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError("Expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                item, pos = decoder.raw_decode(buf, pos)
+            except ValueError:
+                # Incomplete item, wait for the next chunk
+                break
+            yield item
+    raise ValueError("Unterminated JSON array")
+
+
 def setup(hass, config):
     """Set up the MinRenovasjon component."""
-    street_name = config[DOMAIN][CONF_STREET_NAME]
-    street_code = config[DOMAIN][CONF_STREET_CODE]
-    house_no = config[DOMAIN][CONF_HOUSE_NO]
-    county_id = config[DOMAIN][CONF_COUNTY_ID]
-    date_format = config[DOMAIN][CONF_DATE_FORMAT]
+    conf = config[DOMAIN]
+    date_format = conf[CONF_DATE_FORMAT]
+    addresses = conf.get(CONF_ADDRESSES, [conf])
+
+    hub = MinRenovasjonHub(hass.config.path(CACHE_FILE),
+                           conf.get(CONF_MAX_CONCURRENT, DEFAULT_MAX_CONCURRENT))
+    for address in addresses:
+        min_renovasjon = MinRenovasjon(address[CONF_STREET_NAME], address[CONF_STREET_CODE],
+                                       address[CONF_HOUSE_NO], address[CONF_COUNTY_ID],
+                                       date_format, hub)
+        hub.addresses[address.get(CONF_NAME)] = min_renovasjon
+
+    hass.data[DATA_MIN_RENOVASJON] = next(iter(hub.addresses.values()))
+    hass.data[DATA_MIN_RENOVASJON_HUB] = hub
+
+    def refresh(now=None):
+        """Refresh the calendars and sleep until the first pickup date has passed."""
+        next_refresh = dt_util.utcnow() + RETRY_INTERVAL
+        try:
+            hub.refresh()
+            expiry = hub.next_expiry()
+            if expiry is None or expiry <= dt_util.now().date():
+                _LOGGER.warning("No current calendar, retrying in %s", RETRY_INTERVAL)
+            else:
+                next_refresh = dt_util.start_of_local_day(expiry)
+        finally:
+            # Rescheduled even if the refresh raised, so the refreshes never stop
+            _LOGGER.debug("Next calendar refresh at %s", next_refresh)
+            track_point_in_time(hass, refresh, next_refresh)
+
+    def midnight(now):
+        """Count the days until the pickups again, from the new date."""
+        hub.count_days(dt_util.as_local(now).date())
 
-    min_renovasjon = MinRenovasjon(street_name, street_code, house_no, county_id, date_format)
-    hass.data[DATA_MIN_RENOVASJON] = min_renovasjon
+    # Load all calendars concurrently in an executor thread
+    hass.add_job(refresh)
+    track_time_change(hass, midnight, hour=0, minute=0, second=0)
 
     return True
 
 
+class MinRenovasjonHub:
+    """State shared by all addresses.
+
+    Holds the HTTP client, the worker pools and the disk cache, where the
+    fraksjoner are stored once per county.
+    """
+
+    def __init__(self, cache_path=None, max_concurrent=DEFAULT_MAX_CONCURRENT, client=None):
+        self.addresses = {}
+        if client is None:
+            client = MinRenovasjonClient({CONST_APP_KEY: CONST_APP_KEY_VALUE}, max_concurrent)
+        self.client = client
+        # Separate pools, so a refresh never waits for a slot held by itself
+        self.fetch_executor = ThreadPoolExecutor(max_workers=max_concurrent)
+        self._refresh_executor = ThreadPoolExecutor(max_workers=max_concurrent)
+        self._cache_path = cache_path
+        self._cache = None
+        self._cache_lock = threading.Lock()
+        self._county_locks = {}
+        self._listeners = []
+
+    def get(self, url, kommunenr, headers=None, stream=False):
+        """GET with the county header through the rate-limited client."""
+        request_headers = {CONST_KOMMUNE_NUMMER: kommunenr}
+        if headers:
+            request_headers.update(headers)
+        return self.client.get(url, request_headers, stream)
+
+    def county_lock(self, kommunenr):
+        with self._cache_lock:
+            return self._county_locks.setdefault(kommunenr, threading.Lock())
+
+    def _load_cache(self):
+        if self._cache is not None:
+            return self._cache
+        self._cache = {}
+        if self._cache_path is not None and os.path.isfile(self._cache_path):
+            try:
+                with open(self._cache_path) as cache_file:
+                    self._cache = json.load(cache_file)
+            except (OSError, ValueError):
+                _LOGGER.warning("Could not load cache %s", self._cache_path, exc_info=True)
+        return self._cache
+
+    def cache_get(self, section, key):
+        with self._cache_lock:
+            return self._load_cache().get(section, {}).get(key)
+
+    def cache_set(self, section, key, value):
+        with self._cache_lock:
+            self._load_cache().setdefault(section, {})[key] = value
+            if self._cache_path is None:
+                return
+            try:
+                with open(self._cache_path, "w") as cache_file:
+                    json.dump(self._cache, cache_file)
+            except OSError:
+                _LOGGER.warning("Could not save cache %s", self._cache_path, exc_info=True)
+
+    def subscribe(self, listener):
+        """Call `listener` after every refresh, until the returned function is called."""
+        self._listeners.append(listener)
+        return lambda: self._listeners.remove(listener)
+
+    def refresh(self):
+        """Refresh the addresses with passed dates, concurrently, and notify the listeners."""
+        due = [address for address in self.addresses.values() if address.needs_refresh()]
+        _LOGGER.debug("Refreshing %d of %d addresses", len(due), len(self.addresses))
+        for future in [self._refresh_executor.submit(address.refresh_calendar) for address in due]:
+            try:
+                future.result()
+            except (requests.RequestException, ValueError):
+                _LOGGER.warning("Could not refresh calendar, keeping the last one", exc_info=True)
+        _LOGGER.debug("Client metrics: %s", self.client.metrics())
+        for listener in list(self._listeners):
+            listener()
+
+    def count_days(self, today):
+        """Recount the days until the pickups of all addresses and notify the listeners."""
+        for address in self.addresses.values():
+            address.count_days(today)
+        for listener in list(self._listeners):
+            listener()
+
+    def next_expiry(self):
+        """Return the first day any address needs a refresh, or None if unknown."""
+        expiries = [address.next_expiry() for address in self.addresses.values()]
+        if not expiries or None in expiries:
+            return None
+        return min(expiries)
+
+
 class MinRenovasjon:
-    def __init__(self, gatenavn, gatekode, husnr, kommunenr, date_format):
+    __slots__ = ("gatenavn", "gatekode", "husnr", "_kommunenr", "_date_format", "_hub",
+                 "_refresh_lock", "_kalender")
+
+    def __init__(self, gatenavn, gatekode, husnr, kommunenr, date_format, hub=None):
         self.gatenavn = self._url_encode(gatenavn)
         self.gatekode = gatekode
         self.husnr = husnr
         self._kommunenr = kommunenr
         self._date_format = date_format
-        self._kalender_list = self._get_calendar_list()
+        self._hub = hub if hub is not None else MinRenovasjonHub()
+        self._refresh_lock = threading.Lock()
+        self._kalender = {}
 
     @staticmethod
     def _url_encode(string):
@@ -67,123 +299,197 @@ class MinRenovasjon:
             string = string_decoded_encoded
         return string
 
+    def next_expiry(self):
+        """Return the day after the first pickup date, when the data must be refreshed."""
+        first = None
+        for entry in self._kalender.values():
+            # Fractions with a single pickup date have no tommedato_neste
+            pickups = [day for day in (entry.tommedato_forste, entry.tommedato_neste) if day is not None]
+            if not pickups:
+                return None
+            pickup = min(pickups).date()
+            if first is None or pickup < first:
+                first = pickup
+        return first and first + timedelta(days=1)
+
+    def count_days(self, today):
+        for entry in self._kalender.values():
+            entry.count_days(today)
+
+    def needs_refresh(self):
+        return not self._kalender or self._check_for_refresh_of_data(self._kalender)
+
     def refresh_calendar(self):
-        do_refresh = self._check_for_refresh_of_data(self._kalender_list)
-        if do_refresh:
-            self._kalender_list = self._get_calendar_list()
+        with self._refresh_lock:
+            if not self._kalender:
+                self._update_kalender(self._get_calendar_list())
+            elif self._check_for_refresh_of_data(self._kalender):
+                self._update_kalender(self._get_calendar_list(refresh=True))
+
+    def _update_kalender(self, kalender):
+        """Update the entries in place, so references to them stay valid.
+
+        Fractions that are no longer returned, like seasonal ones, are
+        dropped, so their passed dates do not keep the data due for refresh.
+        """
+        for fraksjon_id in self._kalender.keys() - kalender.keys():
+            _LOGGER.info("Fraksjon %s is no longer in the calendar", fraksjon_id)
+            del self._kalender[fraksjon_id]
+        # The local date of Home Assistant, which may differ from the date of the host
+        today = dt_util.now().date()
+        for fraksjon_id, entry in kalender.items():
+            entry.format(self._date_format)
+            entry.count_days(today)
+            if fraksjon_id in self._kalender:
+                self._kalender[fraksjon_id].update(entry)
+            else:
+                self._kalender[fraksjon_id] = entry
 
-    def _get_tommekalender_from_web_api(self):
-        header = {CONST_KOMMUNE_NUMMER: self._kommunenr, CONST_APP_KEY: CONST_APP_KEY_VALUE}
+    @property
+    def _address(self):
+        return "{}|{}|{}|{}".format(self._kommunenr, self.gatenavn, self.gatekode, self.husnr)
 
+    def _get_tommekalender_from_web_api(self):
         url = CONST_URL_TOMMEKALENDER
         url = url.replace('[gatenavn]', self.gatenavn)
         url = url.replace('[gatekode]', self.gatekode)
         url = url.replace('[husnr]', self.husnr)
 
-        response = requests.get(url, headers=header)
-        if response.status_code == requests.codes.ok:
-            data = response.text
-            return data
-        else:
-            _LOGGER.error(response.status_code)
-            return None
+        response = self._hub.get(url, self._kommunenr, stream=True)
+        # Only the fraction id and the dates are kept of each entry
+        with response:
+            return [[entry['FraksjonId'], entry['Tommedatoer']]
+                    for entry in _iter_json_array(response.iter_content(CHUNK_SIZE))]
 
-    def _get_fraksjoner_from_web_api(self):
-        header = {CONST_KOMMUNE_NUMMER: self._kommunenr, CONST_APP_KEY: CONST_APP_KEY_VALUE}
+    def _get_fraksjoner_from_web_api(self, etag=None):
+        """Return (data, etag), with data None if the etag still matches."""
         url = CONST_URL_FRAKSJONER
 
-        response = requests.get(url, headers=header)
-        if response.status_code == requests.codes.ok:
-            data = response.text
+        headers = {"If-None-Match": etag} if etag else None
+        response = self._hub.get(url, self._kommunenr, headers)
+        if response.status_code == requests.codes.not_modified:
+            return None, etag
+        return response.text, response.headers.get("ETag")
+
+    def _get_fraksjoner(self):
+        """Return the fraksjoner, from the cache while it is fresh.
+
+        Shared by all addresses in the county.
+        """
+        with self._hub.county_lock(self._kommunenr):
+            cached = self._hub.cache_get("fraksjoner", self._kommunenr)
+            fresh = cached is not None and time.time() - cached["fetched"] < FRAKSJONER_TTL
+            self._hub.client.record_cache(fresh)
+            if fresh:
+                return cached["data"]
+
+            try:
+                data, etag = self._get_fraksjoner_from_web_api(cached and cached.get("etag"))
+            except requests.RequestException as err:
+                if cached is None:
+                    raise
+                _LOGGER.warning("Could not revalidate fraksjoner, using the cached ones: %s", err)
+                return cached["data"]
+            if data is None:
+                _LOGGER.debug("Fraksjoner not modified")
+                data = cached["data"]
+            self._hub.cache_set("fraksjoner", self._kommunenr,
+                                {"fetched": time.time(), "etag": etag, "data": data})
             return data
-        else:
-            _LOGGER.error(response.status_code)
-            return None
+
+    def _get_tommekalender(self):
+        data = self._get_tommekalender_from_web_api()
+        self._hub.cache_set("tommedatoer", self._address, {"data": data})
+        return data
 
     def _get_from_web_api(self):
-        tommekalender = self._get_tommekalender_from_web_api()
-        fraksjoner = self._get_fraksjoner_from_web_api()
+        tommekalender = self._hub.fetch_executor.submit(self._get_tommekalender)
+        fraksjoner = self._get_fraksjoner()
+        tommekalender = tommekalender.result()
 
-        _LOGGER.debug(f"Tommekalender: {tommekalender}")
-        _LOGGER.debug(f"Fraksjoner: {fraksjoner}")
+        # Only sizes, the documents themselves can be large
+        _LOGGER.debug("Fetched %d tommekalender entries and %d characters of fraksjoner",
+                      len(tommekalender), len(fraksjoner))
 
         return tommekalender, fraksjoner
 
     def _get_calendar_list(self, refresh=False):
-        data = None
+        """Return the calendar, fetched if the cached one is missing or has passed dates.
 
-        if refresh or data is None:
-            _LOGGER.info("Refresh or no data. Fetching from API.")
-            tommekalender, fraksjoner = self._get_from_web_api()
-        else:
-            tommekalender, fraksjoner = data
-
-        kalender_list = self._parse_calendar_list(tommekalender, fraksjoner)
-
-        check_for_refresh = False
+        Raises requests.RequestException if it cannot be fetched and there
+        is no cached calendar; a passed cached calendar is served instead.
+        """
+        kalender = None
         if not refresh:
-            check_for_refresh = self._check_for_refresh_of_data(kalender_list)
-
-        if check_for_refresh:
-            kalender_list = self._get_calendar_list(refresh=True)
-
-        _LOGGER.info("Returning calendar list")
-        return kalender_list
+            cached = self._hub.cache_get("tommedatoer", self._address)
+            if cached is not None:
+                kalender = self._parse_calendar_list(cached["data"], self._get_fraksjoner())
+            fresh = kalender is not None and not self._check_for_refresh_of_data(kalender)
+            self._hub.client.record_cache(fresh)
+            if fresh:
+                _LOGGER.info("Using cached calendar")
+                return kalender
+
+        _LOGGER.info("Refresh or no data. Fetching from API.")
+        try:
+            tommekalender, fraksjoner = self._get_from_web_api()
+        except requests.RequestException as err:
+            if kalender is None:
+                raise
+            _LOGGER.warning("Could not fetch calendar, using the cached one: %s", err)
+            return kalender
+        # Passed dates from the server are kept; the refresh is retried later, not here
+        return self._parse_calendar_list(tommekalender, fraksjoner)
 
     @staticmethod
-    def _parse_calendar_list(tommekalender, fraksjoner):
-        kalender_list = []
+    def _parse_calendar_list(tommedatoer, fraksjoner):
+        """Join the [fraksjon id, dates] rows with the fraksjoner."""
+        kalender = {}
 
-        tommekalender_json = json.loads(tommekalender)
-        fraksjoner_json = json.loads(fraksjoner)
+        fraksjoner_by_id = {fraksjon['Id']: fraksjon for fraksjon in json.loads(fraksjoner)}
 
-        for calender_entry in tommekalender_json:
-            fraksjon_id = calender_entry['FraksjonId']
+        for fraksjon_id, datoer in tommedatoer:
+            fraksjon = fraksjoner_by_id.get(fraksjon_id)
+            if fraksjon is None:
+                continue
             tommedato_neste = None
 
-            if len(calender_entry['Tommedatoer']) == 1:
-                tommedato_forste = calender_entry['Tommedatoer'][0]
+            if len(datoer) == 1:
+                tommedato_forste = datoer[0]
             else:
-                tommedato_forste, tommedato_neste = calender_entry['Tommedatoer']
+                tommedato_forste, tommedato_neste = datoer
 
+            # The dates are always "%Y-%m-%dT%H:%M:%S", which fromisoformat parses much faster
             if tommedato_forste is not None:
-                tommedato_forste = datetime.strptime(tommedato_forste, "%Y-%m-%dT%H:%M:%S")
+                tommedato_forste = datetime.fromisoformat(tommedato_forste)
             if tommedato_neste is not None:
-                tommedato_neste = datetime.strptime(tommedato_neste, "%Y-%m-%dT%H:%M:%S")
+                tommedato_neste = datetime.fromisoformat(tommedato_neste)
 
-            for fraksjon in fraksjoner_json:
-                if fraksjon['Id'] == fraksjon_id:
-                    fraksjon_navn = fraksjon['Navn']
-                    fraksjon_ikon = fraksjon['Ikon']
+            kalender[fraksjon_id] = CalendarEntry(fraksjon_id, fraksjon['Navn'], fraksjon['Ikon'],
+                                                  tommedato_forste, tommedato_neste)
 
-                    kalender_list.append((fraksjon_id, fraksjon_navn, fraksjon_ikon, tommedato_forste, tommedato_neste))
-                    continue
-
-        return kalender_list
+        return kalender
 
     @staticmethod
-    def _check_for_refresh_of_data(kalender_list):
-        for entry in kalender_list:
-            _, _, _, tommedato_forste, tommedato_neste = entry
-
-            if tommedato_forste is None or tommedato_neste is None:
+    def _check_for_refresh_of_data(kalender):
+        today = dt_util.now().date()
+        for entry in kalender.values():
+            if entry.tommedato_forste is None:
                 _LOGGER.info("Data needs refresh")
                 return True
-            if tommedato_forste.date() < date.today() or tommedato_neste.date() < date.today():
+            if entry.tommedato_forste.date() < today or (
+                    entry.tommedato_neste is not None and entry.tommedato_neste.date() < today):
                 _LOGGER.info("Data needs refresh")
                 return True
 
         return False
 
     def get_calender_for_fraction(self, fraksjon_id):
-        for entry in self._kalender_list:
-            entry_fraksjon_id, _, _, _, _= entry
-            if fraksjon_id == entry_fraksjon_id:
-                return entry
+        return self._kalender.get(fraksjon_id)
 
     @property
     def calender_list(self):
-        return self._kalender_list
+        return list(self._kalender.values())
 
     def format_date(self, date):
         if self._date_format == "None":
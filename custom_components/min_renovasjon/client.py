@@ -0,0 +1,189 @@
+"""HTTP client for the MinRenovasjon API."""
+import logging
+import random
+import threading
+import time
+
+import requests
+
+_LOGGER = logging.getLogger(__name__)
+
+# (connect, read) timeout in seconds
+DEFAULT_TIMEOUT = (5, 20)
+DEFAULT_RATE = 2.0
+DEFAULT_BURST = 4
+DEFAULT_RETRY_COUNT = 3
+DEFAULT_RETRY_DELAY = 1.0
+DEFAULT_RETRY_MAX_DELAY = 30.0
+DEFAULT_BREAKER_THRESHOLD = 5
+DEFAULT_BREAKER_COOLDOWN = 600
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised without a request while the circuit breaker is open."""
+
+
+class TokenBucket:
+    """Allow `rate` requests per second on average, with bursts of `burst`."""
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, sleeping until one is available.
+
+        The token is reserved before sleeping, so waiting threads are served
+        in order and never sleep while holding the lock.
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+
+class MinRenovasjonClient:
+    """Rate-limited GET with exponential backoff and a circuit breaker.
+
+    Connection errors, 429 and 5xx responses are retried up to
+    `retry_count` times. After `breaker_threshold` failed requests in a row
+    every request fails with CircuitOpenError for `breaker_cooldown`
+    seconds.
+    """
+
+    def __init__(
+        self,
+        headers=None,
+        pool_size=DEFAULT_BURST,
+        rate=DEFAULT_RATE,
+        burst=DEFAULT_BURST,
+        retry_count=DEFAULT_RETRY_COUNT,
+        base_delay=DEFAULT_RETRY_DELAY,
+        max_delay=DEFAULT_RETRY_MAX_DELAY,
+        breaker_threshold=DEFAULT_BREAKER_THRESHOLD,
+        breaker_cooldown=DEFAULT_BREAKER_COOLDOWN,
+        clock=time.monotonic,
+        sleep=time.sleep,
+        rand=random.random,
+    ):
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        self.session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=pool_size))
+        self.bucket = TokenBucket(rate, burst, clock, sleep)
+        self.retry_count = retry_count
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self._clock = clock
+        self._sleep = sleep
+        self._rand = rand
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._open_until = 0
+
+        self.requests = 0
+        self.failed_requests = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def mean_latency(self):
+        return self.total_latency / self.requests if self.requests else None
+
+    @property
+    def cache_hit_rate(self):
+        lookups = self.cache_hits + self.cache_misses
+        return self.cache_hits / lookups if lookups else None
+
+    def record_cache(self, hit):
+        """Count a lookup that was (hit) or was not served from the cache."""
+        with self._lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+    def metrics(self):
+        return {
+            "requests": self.requests,
+            "failed_requests": self.failed_requests,
+            "mean_latency": self.mean_latency,
+            "max_latency": self.max_latency,
+            "cache_hit_rate": self.cache_hit_rate,
+            "circuit_open": self.is_open(),
+        }
+
+    def is_open(self):
+        """Return True if requests are currently refused."""
+        return self._open_until > self._clock()
+
+    def get(self, url, headers=None, stream=False):
+        """Return the response, or raise requests.RequestException.
+
+        Only responses below 400 are returned, so 304 must be handled by
+        the caller.
+        """
+        if self.is_open():
+            raise CircuitOpenError("MinRenovasjon circuit breaker is open")
+        attempt = 0
+        while True:
+            try:
+                response = self._request(url, headers, stream)
+                if response.status_code == requests.codes.too_many_requests or response.status_code >= 500:
+                    response.close()
+                    response.raise_for_status()
+            except requests.RequestException as err:
+                if attempt >= self.retry_count:
+                    self._failed()
+                    raise
+                # Doubled per attempt, the random half spreads out the clients
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+                delay *= 0.5 + self._rand() / 2
+                _LOGGER.warning("Request to MinRenovasjon failed (%s), retrying in %.1f s", err, delay)
+                attempt += 1
+                self._sleep(delay)
+                continue
+            if response.status_code >= 400:
+                response.close()
+                self._failed()
+                response.raise_for_status()
+            with self._lock:
+                self._failures = 0
+            return response
+
+    def _request(self, url, headers, stream):
+        self.bucket.acquire()
+        start = self._clock()
+        try:
+            return self.session.get(url, headers=headers, timeout=DEFAULT_TIMEOUT, stream=stream)
+        finally:
+            latency = self._clock() - start
+            with self._lock:
+                self.requests += 1
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+
+    def _failed(self):
+        with self._lock:
+            self.failed_requests += 1
+            self._failures += 1
+            if self._failures < self.breaker_threshold:
+                return
+            self._failures = 0
+            self._open_until = self._clock() + self.breaker_cooldown
+        _LOGGER.warning("MinRenovasjon failed %d requests in a row, pausing requests for %d s",
+                        self.breaker_threshold, self.breaker_cooldown)
@@ -1,58 +1,99 @@
-from datetime import timedelta
 import logging
 
 from homeassistant.components.sensor import PLATFORM_SCHEMA
 from homeassistant.helpers.entity import Entity
 import homeassistant.helpers.config_validation as cv
+import requests
 import voluptuous as vol
-from ..min_renovasjon import DATA_MIN_RENOVASJON
+from ..min_renovasjon import DATA_MIN_RENOVASJON, DATA_MIN_RENOVASJON_HUB
 
 _LOGGER = logging.getLogger(__name__)
 
 CONF_FRACTION_ID = "fraction_id"
+CONF_ADDRESS = "address"
+
+ATTR_DAYS_UNTIL = "days_until"
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
     vol.Required(CONF_FRACTION_ID): vol.All(cv.ensure_list),
+    vol.Optional(CONF_ADDRESS): cv.string,
 })
 
-SCAN_INTERVAL = timedelta(minutes=30)
-
 
 def setup_platform(hass, config, add_entities, discovery_info=None):
     fraction_ids = config.get(CONF_FRACTION_ID)
-    min_renovasjon = hass.data[DATA_MIN_RENOVASJON]
+    address = config.get(CONF_ADDRESS)
+    if address is None:
+        min_renovasjon = hass.data[DATA_MIN_RENOVASJON]
+    else:
+        min_renovasjon = hass.data[DATA_MIN_RENOVASJON_HUB].addresses[address]
+
+    # Load the calendar before the entities are added, so they get their
+    # names. The refresh started by the component waits for this one and
+    # does not fetch again.
+    try:
+        min_renovasjon.refresh_calendar()
+    except (requests.RequestException, ValueError):
+        _LOGGER.warning("Could not load calendar, the sensors are named after the first refresh",
+                        exc_info=True)
 
-    add_entities(MinRenovasjonSensor(min_renovasjon, fraction_id) for fraction_id in fraction_ids)
+    add_entities((MinRenovasjonSensor(min_renovasjon, fraction_id, address)
+                  for fraction_id in fraction_ids), True)
 
 
 class MinRenovasjonSensor(Entity):
 
-    def __init__(self, min_renovasjon, fraction_id):
+    def __init__(self, min_renovasjon, fraction_id, address=None):
         """Initialize with API object, device id."""
         self._min_renovasjon = min_renovasjon
         self._fraction_id = fraction_id
+        self._address = address
+        self._fraction = None
+        self._navn = None
 
     @property
     def name(self):
         """Return the name of the fraction if any."""
-        fraction = self._min_renovasjon.get_calender_for_fraction(self._fraction_id)
-        if fraction is not None:
-            return fraction[1]
+        if self._navn is not None:
+            if self._address is not None:
+                return "{} {}".format(self._address, self._navn)
+            return self._navn
 
     @property
     def state(self):
         """Return the state/date of the fraction."""
-        fraction = self._min_renovasjon.get_calender_for_fraction(self._fraction_id)
-        if fraction is not None:
-            return self._min_renovasjon.format_date(fraction[3])
+        if self._fraction is not None:
+            return self._fraction.formatted
+
+    @property
+    def device_state_attributes(self):
+        """Return the number of days until the pickup."""
+        if self._fraction is not None:
+            return {ATTR_DAYS_UNTIL: self._fraction.days_until}
 
     @property
     def entity_picture(self):
         """Symbol."""
-        fraction = self._min_renovasjon.get_calender_for_fraction(self._fraction_id)
-        if fraction is not None:
-            return fraction[2]
+        if self._fraction is not None:
+            return self._fraction.ikon
+
+    @property
+    def should_poll(self):
+        """The calendar is pushed by the component when it is refreshed."""
+        return False
+
+    async def async_added_to_hass(self):
+        """Subscribe to calendar refreshes."""
+        self.async_on_remove(self.hass.data[DATA_MIN_RENOVASJON_HUB].subscribe(self._handle_refresh))
+        # A refresh may have finished before the subscription
+        self.async_schedule_update_ha_state(True)
+
+    def _handle_refresh(self):
+        self.schedule_update_ha_state(True)
 
     def update(self):
-        """Update calendar."""
-        self._min_renovasjon.refresh_calendar()
+        """Look up the fraction in the calendar."""
+        # None if the fraction was dropped from the calendar; the name is kept
+        self._fraction = self._min_renovasjon.get_calender_for_fraction(self._fraction_id)
+        if self._fraction is not None:
+            self._navn = self._fraction.navn
@@ -0,0 +1,70 @@
+"""Make the custom components importable as top-level packages.
+
+Platforms that import their component relatively are imported through
+`custom_components` instead, so the repository root is on the path too.
+Also provides a local stub HTTP server.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "custom_components"))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            server.connections.add(self.client_address)
+            status = server.failures.pop(0) if server.failures else None
+        if status is None:
+            status, body, etag = 200, b"", None
+            for prefix, (route_body, route_etag) in server.routes.items():
+                if self.path.startswith(prefix):
+                    body, etag = route_body, route_etag
+            if etag is not None and self.headers.get("If-None-Match") == etag:
+                status, body = 304, b""
+            time.sleep(server.delay)
+        else:
+            body, etag = b"", None
+        self.send_response(status)
+        if etag is not None:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def http_stub():
+    """A local HTTP server serving `routes`, {path prefix: (body, etag)}.
+
+    The statuses in `failures` are answered first, one per request, and
+    every answer is delayed by `delay` seconds.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.routes = {}
+    server.failures = []
+    server.delay = 0.0
+    server.requests = []
+    server.connections = set()
+    server.url = "http://127.0.0.1:{}".format(server.server_address[1])
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,31 @@
+"""Decoding of Airthings advertisements."""
+import struct
+
+from airthings_wave.adverts import AdvertCache
+
+COMPANY = struct.pack("<H", 0x0334)
+SERIAL = struct.pack("<I", 2930123456)
+RECORD = struct.pack("<BBBBHHHHHHHH", 1, 80, 0, 0, 10, 20, 2150, 49000, 500, 100, 0, 0)
+
+
+def test_record_after_serial_is_decoded():
+    cache = AdvertCache(clock=lambda: 100.0)
+    readings = cache.feed("AA:BB", COMPANY + SERIAL + RECORD)
+    assert readings.as_dict() == {"humidity": 40.0, "radon_1day_avg": 10.0, "radon_longterm_avg": 20.0,
+                                  "temperature": 21.5, "pressure": 980.0, "co2": 500.0, "voc": 100.0}
+    assert cache.discovered == {"aa:bb": True}
+    assert cache.get("aa:bb") is readings
+
+
+def test_serial_only_advert_gives_no_readings():
+    cache = AdvertCache(clock=lambda: 100.0)
+    assert cache.feed("aa:bb", COMPANY + SERIAL) is None
+    assert cache.discovered == {"aa:bb": True}
+    assert cache.get("aa:bb") is None
+
+
+def test_unknown_record_version_is_dropped():
+    cache = AdvertCache(clock=lambda: 100.0)
+    assert cache.feed("aa:bb", COMPANY + SERIAL + b"\x02" + RECORD[1:]) is None
+    assert cache.get("aa:bb") is None
+    assert cache.decoded == 0
@@ -0,0 +1,33 @@
+"""The struct decoders give the same values as the original per-value round()."""
+import random
+import struct
+
+from airthings_wave.decoder import WAVE_DECODER, WAVE_PLUS_DECODER, WAVE_PLUS_SENSORS, WAVE_SENSORS
+
+FORMAT = "<BBBBHHHHHHHH"
+
+
+def _reference_plus(raw):
+    values = struct.unpack(FORMAT, raw)
+    return {sensor.name: round(values[sensor.indx] * sensor.scale, 2) for sensor in WAVE_PLUS_SENSORS}
+
+
+def test_wave_plus_matches_round():
+    rng = random.Random(1)
+    raws = [struct.pack(FORMAT, 1, *(rng.randrange(256) for _ in range(3)),
+                        *(rng.randrange(65536) for _ in range(8))) for _ in range(2000)]
+    for raw in raws:
+        assert WAVE_PLUS_DECODER.decode(raw).as_dict() == _reference_plus(raw)
+    assert [r.as_dict() for r in WAVE_PLUS_DECODER.decode_many(raws)] == [_reference_plus(raw) for raw in raws]
+
+
+def test_wave_matches_round():
+    rng = random.Random(2)
+    for _ in range(2000):
+        values = {}
+        expected = {}
+        for sensor in WAVE_SENSORS:
+            number = rng.randrange(-32768, 32768) if sensor.format_type == "h" else rng.randrange(65536)
+            values[sensor.uuid] = struct.pack(sensor.format_type, number)
+            expected[sensor.name] = round(number * sensor.scale, 2)
+        assert WAVE_DECODER.decode(values).as_dict() == expected
@@ -0,0 +1,52 @@
+"""Devices sharing one pygatt backend, with a fake gatttool backend."""
+from airthings_wave import transport
+from airthings_wave.transport import PygattTransport
+
+
+class FakeDevice:
+    def __init__(self, backend, mac):
+        self._backend = backend
+        self.mac = mac
+
+    def disconnect(self):
+        self._backend.disconnects.append(self.mac)
+
+
+class FakeBackend:
+    """Like GATTToolBackend, one connection at a time."""
+
+    def __init__(self):
+        self.disconnects = []
+
+    def connect(self, mac, timeout):
+        return FakeDevice(self, mac)
+
+
+def _transports(monkeypatch, adapter):
+    backend = FakeBackend()
+    monkeypatch.setattr(transport, "_pygatt_backend", lambda adapter: backend)
+    return backend, PygattTransport("aa:00:00:00:00:01", adapter), PygattTransport("aa:00:00:00:00:02", adapter)
+
+
+def test_connecting_another_device_replaces_the_connection(monkeypatch):
+    _, first, second = _transports(monkeypatch, 301)
+    first.connect(1.0)
+    assert first.is_connected()
+    second.connect(1.0)
+    assert second.is_connected()
+    assert not first.is_connected()
+    first.connect(1.0)
+    assert first.is_connected()
+    assert not second.is_connected()
+
+
+def test_disconnect_leaves_the_other_device_connected(monkeypatch):
+    backend, first, second = _transports(monkeypatch, 302)
+    first.connect(1.0)
+    second.connect(1.0)
+    first.disconnect()
+    assert backend.disconnects == []
+    assert second.is_connected()
+    second.disconnect()
+    assert backend.disconnects == ["aa:00:00:00:00:02"]
+    assert not second.is_connected()
@@ -0,0 +1,155 @@
+"""RetryEngine on a fake clock, and the async read path with a fake GATT client."""
+import asyncio
+import struct
+
+import pytest
+
+from airthings_wave import airthings
+from airthings_wave.airthings import AirthingsWave, HandleCache, RetryEngine
+from airthings_wave.decoder import WAVE_PLUS_UUID
+
+RECORD = struct.pack("<BBBBHHHHHHHH", 1, 80, 0, 0, 10, 20, 2150, 49000, 500, 100, 0, 0)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.now += delay
+
+    async def async_sleep(self, delay):
+        self.sleep(delay)
+
+
+def _engine(clock, **kwargs):
+    return RetryEngine(clock=clock, sleep=clock.sleep, async_sleep=clock.async_sleep,
+                       rand=lambda: 1.0, **kwargs)
+
+
+def _flaky(failures, result="ok"):
+    calls = []
+
+    def func():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise OSError("failed")
+        return result
+    return func, calls
+
+
+def test_run_backs_off_exponentially():
+    clock = FakeClock()
+    func, calls = _flaky(3)
+    assert _engine(clock, base_delay=0.5).run("dev", func, (OSError,), retry_count=5) == "ok"
+    assert len(calls) == 4
+    assert clock.sleeps == [0.5, 1.0, 2.0]
+
+
+def test_run_gives_up_at_budget_and_opens_breaker():
+    clock = FakeClock()
+    engine = _engine(clock, base_delay=1.0, budget=5.0, breaker_threshold=2, breaker_cooldown=100.0)
+    func, calls = _flaky(100)
+    assert engine.run("dev", func, (OSError,), retry_count=10) is None
+    # 1 + 2 = 3 s of backoff, the next 4 s would pass the 5 s budget
+    assert clock.sleeps == [1.0, 2.0]
+    assert not engine.is_open("dev")
+    assert engine.run("dev", func, (OSError,), retry_count=10) is None
+    assert engine.is_open("dev")
+    calls.clear()
+    assert engine.run("dev", func, (OSError,)) is None
+    assert calls == []
+    clock.now += 100.0
+    assert not engine.is_open("dev")
+
+
+def test_async_run_cancels_hung_attempt_at_budget():
+    clock = FakeClock()
+    engine = _engine(clock, budget=0.05)
+    cancelled = []
+
+    async def hang():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    assert asyncio.run(engine.async_run("dev", hang, (OSError,), retry_count=3)) is None
+    assert cancelled == [1]
+
+
+class FakeGattClient:
+    """In-process stand-in for BleakClient serving one Wave Plus record."""
+
+    delay = 0.0
+    connects = 0
+
+    def __init__(self, mac, adapter=None):
+        self.mac = mac
+
+    async def __aenter__(self):
+        FakeGattClient.connects += 1
+        await asyncio.sleep(self.delay)
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def read_gatt_char(self, uuid):
+        assert uuid == WAVE_PLUS_UUID
+        return bytearray(RECORD)
+
+
+@pytest.fixture
+def fake_bleak(monkeypatch):
+    monkeypatch.setattr(airthings, "BleakClient", FakeGattClient)
+    monkeypatch.setattr(airthings, "ASYNC_READ_ERRORS", (OSError,))
+    FakeGattClient.delay = 0.0
+    FakeGattClient.connects = 0
+    return FakeGattClient
+
+
+def _wave(adapter, engine):
+    return AirthingsWave("aa:00:00:00:02:00", 300, is_plus=True, adapter=adapter,
+                         retry_engine=engine, handle_cache=HandleCache())
+
+
+def test_async_get_readings_reads_fake_gatt_server(fake_bleak):
+    wave = _wave(201, RetryEngine())
+    readings = asyncio.run(wave.async_get_readings())
+    assert readings["humidity"] == 40.0
+    assert fake_bleak.connects == 1
+    assert wave.last_poll_duration is not None
+    assert wave.mean_poll_duration == wave.last_poll_duration
+
+
+def test_async_get_readings_times_out_hung_connect(fake_bleak):
+    fake_bleak.delay = 10.0
+    clock = FakeClock()
+    wave = _wave(202, _engine(clock, budget=0.05))
+    readings = asyncio.run(wave.async_get_readings())
+    assert len(readings) == 0
+    assert fake_bleak.connects == 1
+    assert wave.scheduler.queue_depth == 0
+
+
+def test_async_read_waits_for_the_adapter_slot(fake_bleak):
+    wave = _wave(203, RetryEngine())
+
+    async def read_while_slot_is_held():
+        with wave.scheduler.slot():
+            task = asyncio.ensure_future(wave.async_get_readings())
+            await asyncio.sleep(0.1)
+            assert fake_bleak.connects == 0
+        return await task
+
+    readings = asyncio.run(read_while_slot_is_held())
+    assert readings["humidity"] == 40.0
+    assert fake_bleak.connects == 1
+    assert wave.scheduler.queue_depth == 0
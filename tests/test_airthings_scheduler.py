@@ -0,0 +1,111 @@
+"""Adapter scheduling of Airthings reads, with fake peripherals."""
+import struct
+import threading
+import time
+import types
+
+from airthings_wave import transport
+from airthings_wave.airthings import AirthingsWave, HandleCache, RetryEngine, get_scheduler
+from airthings_wave.decoder import WAVE_PLUS_UUID
+from airthings_wave.transport import BluepyTransport, FakeTransport
+
+LATENCY = 0.05
+RECORD = struct.pack("<BBBBHHHHHHHH", 1, 80, 0, 0, 10, 20, 2150, 49000, 500, 100, 0, 0)
+
+
+def _poll_all(adapters, devices=4):
+    """Poll `devices` fake Wave Plus in parallel, spread over `adapters`."""
+    waves = []
+    for i in range(devices):
+        fake = FakeTransport("aa:00:00:00:00:%02x" % i, adapters[i % len(adapters)],
+                             {WAVE_PLUS_UUID: RECORD}, latency=LATENCY)
+        waves.append(AirthingsWave(fake._mac, 300, is_plus=True, adapter=adapters[i % len(adapters)],
+                                   retry_engine=RetryEngine(), handle_cache=HandleCache(),
+                                   transport=fake))
+    threads = [threading.Thread(target=wave.poll) for wave in waves]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.monotonic() - start, waves
+
+
+def test_reads_on_one_adapter_are_serialized():
+    duration, waves = _poll_all([101])
+    # connect + discover + read per device, one device at a time
+    assert duration >= 4 * 3 * LATENCY
+    assert all(wave.readings["humidity"] == 40.0 for wave in waves)
+    assert waves[0].scheduler.reads == 4
+
+
+def test_poll_time_scales_down_with_adapters():
+    one_adapter, _ = _poll_all([111])
+    four_adapters, _ = _poll_all([121, 122, 123, 124])
+    assert four_adapters < one_adapter / 2
+
+
+def test_bluepy_connect_gets_slot_timeout(monkeypatch):
+    calls = []
+
+    class Peripheral:
+        def __init__(self, mac, iface=None, timeout=None):
+            calls.append((mac, iface, timeout))
+
+    btle = types.SimpleNamespace(Peripheral=Peripheral, BTLEException=Exception)
+    monkeypatch.setattr(transport, "bluepy", types.SimpleNamespace(btle=btle))
+    BluepyTransport("aa:bb", 1).connect(12.5)
+    assert calls == [("aa:bb", 1, 12.5)]
+
+
+def test_poll_is_skipped_while_previous_poll_runs():
+    fake = FakeTransport("aa:00:00:00:01:00", 131, {WAVE_PLUS_UUID: RECORD}, latency=LATENCY)
+    wave = AirthingsWave(fake._mac, 300, is_plus=True, adapter=131, retry_engine=RetryEngine(),
+                         handle_cache=HandleCache(), transport=fake)
+    first = threading.Thread(target=wave.poll)
+    first.start()
+    time.sleep(LATENCY / 2)
+    assert wave.poll() is None
+    first.join()
+    assert wave.physical_reads == 1
+    assert wave.poll() is not None
+
+
+def test_poll_gives_up_waiting_for_the_adapter_within_budget():
+    scheduler = get_scheduler(141)
+    fake = FakeTransport("aa:00:00:00:02:00", 141, {WAVE_PLUS_UUID: RECORD})
+    wave = AirthingsWave(fake._mac, 300, is_plus=True, adapter=141,
+                         retry_engine=RetryEngine(budget=0.3), handle_cache=HandleCache(), transport=fake)
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with scheduler.slot():
+            held.set()
+            release.wait()
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    held.wait()
+    start = time.monotonic()
+    assert not wave.poll()
+    assert time.monotonic() - start < 0.5
+    release.set()
+    holder.join()
+    # The abandoned place in the queue does not block the adapter
+    assert scheduler.queue_depth == 0
+    assert wave.poll()["humidity"] == 40.0
+
+
+def test_hung_read_is_ended_by_the_slot():
+    scheduler = get_scheduler(151)
+    scheduler.slot_time = 0.2
+    fake = FakeTransport("aa:00:00:00:03:00", 151, {WAVE_PLUS_UUID: RECORD}, latency=LATENCY)
+    wave = AirthingsWave(fake._mac, 300, is_plus=True, adapter=151, retry_count=0,
+                         retry_engine=RetryEngine(), handle_cache=HandleCache(), transport=fake)
+    wave.poll()
+    fake.latency = 5.0
+    start = time.monotonic()
+    assert not wave.poll()
+    assert time.monotonic() - start < 0.5
+    assert not fake.is_connected()
@@ -0,0 +1,41 @@
+"""Configuration of the Airthings sensor platform."""
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from airthings_wave import sensor  # noqa: E402
+from airthings_wave.adaptive import DEFAULT_THRESHOLDS  # noqa: E402
+
+
+class FakeHass:
+    def __init__(self):
+        self.data = {}
+        self.config = self
+        self.bus = self
+        self.jobs = []
+
+    def path(self, name):
+        return None
+
+    def listen_once(self, event, listener):
+        pass
+
+    def add_job(self, job):
+        self.jobs.append(job)
+
+
+def test_thresholds_are_passed_to_the_adaptive_interval(monkeypatch):
+    monkeypatch.setattr(sensor, "track_time_interval", lambda *args: None)
+    config = sensor.PLATFORM_SCHEMA({
+        "platform": "airthings_wave",
+        sensor.CONF_MAC: "aa:00:00:00:04:00",
+        sensor.CONF_ADAPTIVE: True,
+        sensor.CONF_THRESHOLDS: {"temperature": "0.3", "co2": 50},
+    })
+    devices = []
+    sensor.setup_platform(FakeHass(), config, lambda entities: devices.append(entities[0].device))
+
+    thresholds = devices[0]._adaptive.thresholds
+    assert thresholds["temperature"] == 0.3
+    assert thresholds["co2"] == 50.0
+    assert thresholds["humidity"] == DEFAULT_THRESHOLDS["humidity"]
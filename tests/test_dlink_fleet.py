@@ -0,0 +1,56 @@
+"""Polling order of a D-Link plug fleet."""
+from datetime import timedelta
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from dlink import fleet  # noqa: E402
+from dlink.fleet import PlugFleet  # noqa: E402
+
+
+class FakeData:
+    def __init__(self, polled, name):
+        self._polled = polled
+        self.name = name
+        self.polls = 0
+        self.last_poll_duration = 0.0
+
+    def subscribe(self, listener):
+        pass
+
+    def update(self):
+        self._polled.append(self.name)
+
+
+def test_first_polls_are_staggered(monkeypatch):
+    intervals = []
+    monkeypatch.setattr(fleet, "track_time_interval",
+                        lambda hass, action, interval: intervals.append(interval))
+    polled = []
+    plugs = PlugFleet(None, max_workers=1)
+    for name in "abc":
+        plugs.add(FakeData(polled, name))
+
+    plugs.start(timedelta(minutes=3))
+    assert polled == ["a"]
+    assert intervals == [timedelta(minutes=1)]
+    for _ in range(4):
+        plugs.tick()
+    assert polled == ["a", "b", "c", "a", "b"]
+
+
+def test_latency_is_logged_every_round_after_the_samples_are_full(monkeypatch):
+    logged = []
+    monkeypatch.setattr(fleet._LOGGER, "debug", lambda msg, *args: logged.append(args))
+    plugs = PlugFleet(None, max_workers=1, latency_samples=10)
+    datas = [FakeData([], name) for name in "abc"]
+    listeners = []
+    for data in datas:
+        data.subscribe = listeners.append
+        plugs.add(data)
+    for _ in range(10):
+        for data, listener in zip(datas, listeners):
+            data.polls += 1
+            listener()
+    assert len(logged) == 10
@@ -0,0 +1,41 @@
+"""Backoff of unreachable D-Link plugs, with a fake clock."""
+from dlink.health import HostHealth
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_backoff_doubles_up_to_the_maximum():
+    health = HostHealth(base_delay=60, max_delay=300, clock=FakeClock())
+    assert [health.failed() for _ in range(5)] == [60, 120, 240, 300, 300]
+
+
+def test_host_is_skipped_until_the_backoff_has_passed():
+    clock = FakeClock()
+    health = HostHealth(base_delay=60, clock=clock)
+    assert health.allow() and health.healthy and not health.half_open
+    health.failed()
+    clock.now = 59
+    assert not health.allow()
+    assert not health.half_open
+    assert health.retry_in() == 1
+    clock.now = 60
+    assert health.allow()
+    assert health.half_open
+
+
+def test_success_closes_the_backoff():
+    clock = FakeClock()
+    health = HostHealth(base_delay=60, clock=clock)
+    health.failed()
+    health.failed()
+    assert health.succeeded()
+    assert health.healthy and health.allow()
+    assert not health.succeeded()
+    # The next failure starts from the base delay again
+    assert health.failed() == 60
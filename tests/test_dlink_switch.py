@@ -0,0 +1,118 @@
+"""Confirmation of D-Link switch commands."""
+import logging
+
+import pytest
+
+pytest.importorskip("homeassistant")
+pytest.importorskip("pyW215")
+
+import requests  # noqa: E402
+
+from dlink.hnap import SessionSmartPlug  # noqa: E402
+from dlink.switch import RequestPacer, SmartPlugData  # noqa: E402
+
+
+class FakeHass:
+    """Runs the executor jobs when asked to."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def add_job(self, job):
+        self.jobs.append(job)
+
+    def run_jobs(self):
+        while self.jobs:
+            self.jobs.pop(0)()
+
+
+class FakePlug:
+    ip = "10.0.0.2"
+
+    def __init__(self):
+        self.state = "OFF"
+
+
+def test_only_the_last_command_is_confirmed(caplog):
+    hass = FakeHass()
+    data = SmartPlugData(hass, FakePlug(), spacing=0)
+    shown = []
+    data.subscribe(lambda: shown.append(data.state))
+
+    data.set_state("ON")
+    data.set_state("OFF")
+    with caplog.at_level(logging.WARNING):
+        hass.run_jobs()
+
+    assert data.state == "OFF"
+    # The confirmation of ON was skipped, so the switch never flicked back on
+    assert shown == ["ON", "OFF", "OFF"]
+    assert "after switching" not in caplog.text
+
+
+class FakePool:
+    """A busy worker pool that runs its jobs when asked to."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, job, *args):
+        self.jobs.append(lambda: job(*args))
+
+    def run_jobs(self):
+        while self.jobs:
+            self.jobs.pop(0)()
+
+
+def test_command_does_not_wait_in_the_busy_pool():
+    hass = FakeHass()
+    pool = FakePool()
+    pacer = RequestPacer(hass, spacing=0, executor=pool)
+    ran = []
+    pacer.submit(lambda: ran.append("poll"))
+    pacer.submit(lambda: ran.append("command"), command=True)
+
+    # The pool job was queued before the command, but leaves it to hass
+    pool.run_jobs()
+    assert ran == []
+    hass.run_jobs()
+    assert ran == ["command"]
+    pool.run_jobs()
+    assert ran == ["command", "poll"]
+
+
+class DeadPlug(SessionSmartPlug):
+    """SessionSmartPlug without the network, where nothing answers."""
+
+    def __init__(self, reachable):
+        self.ip = "10.0.0.3"
+        self.url = "http://10.0.0.3/HNAP1/"
+        self.user = "admin"
+        self.password = "1234"
+        self.use_legacy_protocol = False
+        self.authenticated = None
+        self.exchanges = 0
+        self.logins = 0
+        self.probes = 0
+        self._reachable = reachable
+
+    def reachable(self, timeout=None):
+        self.probes += 1
+        return self._reachable
+
+    def _post(self, payload, headers):
+        self.exchanges += 1
+        raise requests.ConnectionError("No answer")
+
+
+@pytest.mark.parametrize("reachable", [False, True])
+def test_half_open_poll_probes_the_plug_once(reachable):
+    plug = DeadPlug(reachable)
+    data = SmartPlugData(FakeHass(), plug, spacing=0)
+    data.health.failed()
+    data.health._retry_at = 0.0
+    assert data.health.half_open
+
+    assert not data._read_state()
+    assert plug.probes == 1
+    assert plug.exchanges == (1 if reachable else 0)
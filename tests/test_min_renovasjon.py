@@ -0,0 +1,123 @@
+"""Calendar expiry and refresh scheduling of Min renovasjon."""
+from datetime import date, datetime, timedelta
+import types
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+import min_renovasjon  # noqa: E402
+from min_renovasjon import CalendarEntry, MinRenovasjon, MinRenovasjonHub  # noqa: E402
+
+
+def _address(tmp_path, kalender):
+    address = MinRenovasjon("Min gate", "12345", "12", "1234", "None",
+                            MinRenovasjonHub(str(tmp_path / "cache.json")))
+    address._kalender = kalender
+    return address
+
+
+# A date the host clock is unlikely to be on, to catch uses of date.today()
+TODAY = date(2030, 1, 15)
+
+
+@pytest.fixture(autouse=True)
+def frozen_clock(monkeypatch):
+    """Freeze the local time of Home Assistant at noon on TODAY."""
+    monkeypatch.setattr(min_renovasjon.dt_util, "now",
+                        lambda: datetime.combine(TODAY, datetime.min.time()).replace(hour=12))
+
+
+def _day(days):
+    return datetime.combine(TODAY + timedelta(days=days), datetime.min.time())
+
+
+def test_single_pickup_date_expires_after_it(tmp_path):
+    address = _address(tmp_path, {
+        1: CalendarEntry(1, "Restavfall", "", _day(3), None),
+        2: CalendarEntry(2, "Papir", "", _day(5), _day(19)),
+    })
+    assert address.next_expiry() == TODAY + timedelta(days=4)
+    assert not address.needs_refresh()
+
+
+def test_passed_single_pickup_date_needs_refresh(tmp_path):
+    address = _address(tmp_path, {1: CalendarEntry(1, "Restavfall", "", _day(-1), None)})
+    assert address.needs_refresh()
+
+
+def test_days_until_counts_from_the_local_date(tmp_path):
+    address = _address(tmp_path, {})
+    address._update_kalender({1: CalendarEntry(1, "Restavfall", "", _day(3), _day(17))})
+    assert address.get_calender_for_fraction(1).days_until == 3
+
+
+def test_midnight_counts_from_the_callback_date(tmp_path, monkeypatch):
+    callbacks = []
+    monkeypatch.setattr(min_renovasjon, "track_point_in_time", lambda *args: None)
+    monkeypatch.setattr(min_renovasjon, "track_time_change",
+                        lambda hass, action, **kwargs: callbacks.append(action))
+    monkeypatch.setattr(MinRenovasjonHub, "refresh", lambda hub: None)
+    hass = _setup(tmp_path)
+    hub = hass.data[min_renovasjon.DATA_MIN_RENOVASJON_HUB]
+    hub.addresses[None]._kalender = {1: CalendarEntry(1, "Restavfall", "", _day(3), _day(17))}
+
+    (midnight,) = callbacks
+    midnight(_day(1).astimezone())
+    assert hub.addresses[None].get_calender_for_fraction(1).days_until == 2
+
+
+def _setup(tmp_path):
+    hass = types.SimpleNamespace(config=types.SimpleNamespace(path=lambda name: str(tmp_path / name)),
+                                 data={}, add_job=lambda job: job())
+    config = {min_renovasjon.DOMAIN: {
+        min_renovasjon.CONF_STREET_NAME: "Min gate",
+        min_renovasjon.CONF_STREET_CODE: "12345",
+        min_renovasjon.CONF_HOUSE_NO: "12",
+        min_renovasjon.CONF_COUNTY_ID: "1234",
+        min_renovasjon.CONF_DATE_FORMAT: "None",
+    }}
+    min_renovasjon.setup(hass, config)
+    return hass
+
+
+def test_refresh_is_rescheduled_when_it_raises(tmp_path, monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(min_renovasjon, "track_point_in_time",
+                        lambda hass, action, point: scheduled.append(point))
+    monkeypatch.setattr(min_renovasjon, "track_time_change", lambda *args, **kwargs: None)
+
+    def fail(hub):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(MinRenovasjonHub, "refresh", fail)
+    with pytest.raises(RuntimeError):
+        _setup(tmp_path)
+    assert len(scheduled) == 1
+
+
+def test_json_array_split_across_chunks():
+    document = '[{"FraksjonId": 1, "Tommedatoer": ["2030-01-18T00:00:00", null]}, \n {"Navn": "Blå"}]'
+    raw = document.encode()
+    items = list(min_renovasjon._iter_json_array(raw[i:i + 5] for i in range(0, len(raw), 5)))
+    assert items == [{"FraksjonId": 1, "Tommedatoer": ["2030-01-18T00:00:00", None]}, {"Navn": "Blå"}]
+
+
+def test_json_array_must_be_terminated():
+    with pytest.raises(ValueError):
+        list(min_renovasjon._iter_json_array([b'[{"a": 1}, ']))
+
+
+def test_fraction_missing_from_the_response_is_dropped(tmp_path):
+    address = _address(tmp_path, {})
+    address._update_kalender({
+        1: CalendarEntry(1, "Restavfall", "", _day(3), _day(17)),
+        10: CalendarEntry(10, "Hageavfall", "", _day(-2), None),
+    })
+    entry = address.get_calender_for_fraction(1)
+    address._update_kalender({1: CalendarEntry(1, "Restavfall", "", _day(5), _day(19))})
+    assert address.get_calender_for_fraction(10) is None
+    assert address.get_calender_for_fraction(1) is entry
+    assert entry.days_until == 5
+    assert not address.needs_refresh()
+    assert address.next_expiry() == TODAY + timedelta(days=6)
@@ -0,0 +1,85 @@
+"""The MinRenovasjon HTTP client, with a fake clock and a local stub server."""
+import pytest
+
+pytest.importorskip("homeassistant")
+
+import requests  # noqa: E402
+
+from min_renovasjon.client import CircuitOpenError, MinRenovasjonClient, TokenBucket  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def api(http_stub):
+    http_stub.routes = {"/fraksjoner": (b"[]", '"v1"')}
+    return http_stub
+
+
+def _client(clock, **kwargs):
+    return MinRenovasjonClient(clock=clock, sleep=clock.sleep, rand=lambda: 1.0, **kwargs)
+
+
+def test_token_bucket_allows_bursts_then_the_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, burst=4, clock=clock, sleep=clock.sleep)
+    for _ in range(4):
+        assert bucket.acquire() == 0
+    # Sleeping for the token moves the clock on, so every later wait is 1 / rate
+    assert bucket.acquire() == 0.5
+    assert bucket.acquire() == 0.5
+    clock.now += 10
+    assert bucket.acquire() == 0
+    assert clock.sleeps == [0.5, 0.5]
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_retries_with_backoff(api, status):
+    clock = FakeClock()
+    client = _client(clock, base_delay=1.0, rate=1000)
+    api.failures = [status, status]
+    response = client.get(api.url + "/fraksjoner")
+    assert response.status_code == 200
+    assert clock.sleeps == [1.0, 2.0]
+    assert client.metrics()["requests"] == 3
+
+
+def test_client_error_is_not_retried(api):
+    clock = FakeClock()
+    client = _client(clock, rate=1000)
+    api.failures = [404]
+    with pytest.raises(requests.HTTPError):
+        client.get(api.url + "/fraksjoner")
+    assert clock.sleeps == []
+
+
+def test_breaker_opens_after_failures_and_closes_after_cooldown(api):
+    clock = FakeClock()
+    client = _client(clock, retry_count=0, breaker_threshold=2, breaker_cooldown=600, rate=1000)
+    api.failures = [500, 500]
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            client.get(api.url + "/fraksjoner")
+    with pytest.raises(CircuitOpenError):
+        client.get(api.url + "/fraksjoner")
+    assert len(api.requests) == 2
+    clock.now += 600
+    assert client.get(api.url + "/fraksjoner").status_code == 200
+
+
+def test_not_modified_is_returned_to_the_caller(api):
+    client = _client(FakeClock(), rate=1000)
+    response = client.get(api.url + "/fraksjoner", headers={"If-None-Match": '"v1"'})
+    assert response.status_code == 304
+    assert not client.is_open()
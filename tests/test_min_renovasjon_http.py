@@ -0,0 +1,44 @@
+"""Min renovasjon against a local stub HTTP server."""
+import json
+import time
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+import min_renovasjon  # noqa: E402
+from min_renovasjon import MinRenovasjon, MinRenovasjonHub  # noqa: E402
+
+FRAKSJONER = [{"Id": 1, "Navn": "Restavfall", "Ikon": "rest.png"},
+              {"Id": 2, "Navn": "Papir", "Ikon": "papir.png"}]
+TOMMEKALENDER = [{"FraksjonId": 1, "Tommedatoer": ["2099-01-05T00:00:00", "2099-01-19T00:00:00"]},
+                 {"FraksjonId": 2, "Tommedatoer": ["2099-01-12T00:00:00"]}]
+
+
+@pytest.fixture
+def api(http_stub, monkeypatch):
+    http_stub.routes = {
+        "/fraksjoner": (json.dumps(FRAKSJONER).encode(), '"v1"'),
+        "/tommekalender": (json.dumps(TOMMEKALENDER).encode(), None),
+    }
+    monkeypatch.setattr(min_renovasjon, "CONST_URL_FRAKSJONER", http_stub.url + "/fraksjoner")
+    monkeypatch.setattr(min_renovasjon, "CONST_URL_TOMMEKALENDER",
+                        http_stub.url + "/tommekalender?gatenavn=[gatenavn]&gatekode=[gatekode]&husnr=[husnr]")
+    return http_stub
+
+
+def test_endpoints_are_fetched_concurrently_over_one_session(api, tmp_path):
+    api.delay = 0.3
+    address = MinRenovasjon("Min gate", "12345", "12", "1234", "None",
+                            MinRenovasjonHub(str(tmp_path / "cache.json")))
+    start = time.monotonic()
+    address.refresh_calendar()
+    # One after the other the two requests take 0.6 s
+    assert time.monotonic() - start < 0.55
+    assert address.get_calender_for_fraction(1).navn == "Restavfall"
+    assert address.get_calender_for_fraction(2).tommedato_neste is None
+
+    address._update_kalender(address._get_calendar_list(refresh=True))
+    # The fraksjoner are cached, and the kept-alive connections are reused
+    assert len(api.requests) == 3
+    assert len(api.connections) == 2
@@ -0,0 +1,39 @@
+"""Setup of the Min renovasjon sensors."""
+from datetime import datetime
+import types
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from custom_components import min_renovasjon  # noqa: E402
+from custom_components.min_renovasjon import sensor  # noqa: E402
+from custom_components.min_renovasjon import CalendarEntry, MinRenovasjon, MinRenovasjonHub  # noqa: E402
+
+
+def test_calendar_is_loaded_before_the_entities_are_added(tmp_path, monkeypatch):
+    hub = MinRenovasjonHub(str(tmp_path / "cache.json"))
+    address = MinRenovasjon("Min gate", "12345", "12", "1234", "None", hub)
+    hub.addresses[None] = address
+    fetches = []
+
+    def fetch(self, refresh=False):
+        fetches.append(refresh)
+        return {1: CalendarEntry(1, "Restavfall", "", datetime(2030, 1, 18), None)}
+
+    monkeypatch.setattr(MinRenovasjon, "_get_calendar_list", fetch)
+    hass = types.SimpleNamespace(data={min_renovasjon.DATA_MIN_RENOVASJON: address,
+                                       min_renovasjon.DATA_MIN_RENOVASJON_HUB: hub})
+    added = []
+
+    def add_entities(entities, update_before_add=False):
+        for entity in entities:
+            if update_before_add:
+                entity.update()
+            added.append(entity)
+
+    sensor.setup_platform(hass, {sensor.CONF_FRACTION_ID: [1]}, add_entities)
+    assert [entity.name for entity in added] == ["Restavfall"]
+    # A later refresh of the component reuses the loaded calendar
+    address.refresh_calendar()
+    assert fetches == [False]